@@ -4,4 +4,9 @@ from .asserts import *
 from .tests import *
 from .tester import *
 from .tools import *
+from .diff import *
+from .process import *
+from .store import *
+from .bench import *
+from .batch import *
 from .experimental import *
@@ -1,38 +1,55 @@
-import hashlib
-import difflib
 import sys
 from typing import List, Union, Tuple
 
 from suite import tools
 from suite import config
+from suite import diff
+from suite import process
 from suite import results
 
 # Asserts.
 
 class Expected:
-	def __init__(self, stdout: Union[List[str], str] = None, stderr: str = None, is_success: bool = True, is_sha256: bool = False, exitcode: int = 0, show_diff: bool = False):
+	def __init__(self, stdout: Union[List[str], str] = None, stderr: str = None, is_success: bool = True, is_sha256: bool = False, exitcode: int = 0, show_diff: bool = False, early_abort: bool = False, golden: str = None):
 		self.stdout: Union[List[str], str] = None
 		if stdout and not is_sha256:
 			if isinstance(stdout, str):
 				self.stdout = stdout + ("\n" if not stdout.endswith("\n") else "")
 			else:
 				self.stdout = [out + "\n" if not out.endswith("\n") else out for out in stdout]
+		elif stdout and is_sha256:
+			self.stdout = stdout.lower()
 		self.stderr = stderr
 		self.is_success = is_success
 		self.is_sha256 = is_sha256
 		self.exitcode = exitcode
 		self.show_diff = show_diff
+		self.early_abort = early_abort
+		self.golden = golden
+
+	def make_sink(self):
+		if self.golden is not None:
+			return process.GoldenSink(self.golden)
+		# SHA-256 is computed while output arrives, so the output itself is never kept.
+		if self.is_sha256:
+			return process.Sha256Sink()
+		# Exact match can be checked while output arrives, program is stopped on first difference.
+		if self.early_abort and self.is_success and isinstance(self.stdout, str):
+			return process.CompareSink(self.stdout)
+		# Large output is compared with single expected text while it is read back.
+		return process.TextSink(expected = self.stdout if self.is_success and isinstance(self.stdout, str) else None)
+
+	def __str_divergence(self, divergence: int) -> str:
+		if self.golden is not None:
+			return "Output differs from golden file %s at byte %d" % (self.golden, divergence)
+		return "Output differs from expected at offset %d" % (divergence)
 
 	def __compare_single(self, actual: str, expected: str, show_diff: bool) -> Tuple[bool, str]:
 		if actual == expected:
 			return True, None
 
 		if show_diff:
-			diff = difflib.unified_diff(
-				expected.splitlines(), actual.splitlines(),
-				fromfile = 'expected_stdout', tofile = 'actual_stdout'
-			)
-			ndiff = '\n'.join(diff)
+			ndiff = diff.unified(expected, actual)
 			return False, "Expected:\n\"\"\"\n%s\"\"\"\nbut actual is:\n\"\"\"\n%s\"\"\"Difference (https://docs.python.org/3/library/difflib.html#difflib.unified_diff): \n%s\n" %  (expected, actual, ndiff)
 		else:
 			return False, "Expected:\n\"\"\"\n%s\"\"\"\nbut actual is:\n\"\"\"\n%s\"\"\"" %  (expected, actual)
@@ -50,7 +67,7 @@ class Expected:
 			return self.__compare_multi(actual, expected)
 
 	def compare(self, other: 'Expected', timer: int, name: str, stdin: str, categories: List[str]) -> results.TestResult:
-		expected_stdout = self.stdout
+		expected_stdout = self.stdout if self.golden is None else "<%s>" % (self.golden)
 		expected_success = self.is_success
 		expected_sha256 = self.is_sha256
 		expected_exitcode = self.exitcode
@@ -60,6 +77,26 @@ class Expected:
 		actual_exitcode = other.exitcode
 		empty_error = actual_stderr == None or actual_stderr == ""
 
+		if other.output_limit is not None:
+			return results.TestResult(False, name,
+                              expected_success, stdin, actual_stdout,
+                              expected_stdout, empty_error,
+                              timer, actual_exitcode, "Output limit exceeded, program wrote more than %d bytes." % (other.output_limit), categories = categories, verdict = process.Status.OUTPUT_LIMIT)
+
+		if other.limit is not None:
+			print("====> FAILING \"%s\"... STDERR:\n\"\"\"\n%s\"\"\"" % (name, actual_stderr), file = sys.stderr)
+			return results.TestResult(False, name,
+                              expected_success, stdin, actual_stdout,
+                              expected_stdout, empty_error,
+                              timer, actual_exitcode, other.limit[0].upper() + other.limit[1:] + ".", categories = categories, verdict = other.verdict)
+
+		if other.stopped:
+			print("====> FAILING \"%s\"... STDERR:\n\"\"\"\n%s\"\"\"" % (name, actual_stderr), file = sys.stderr)
+			return results.TestResult(False, name,
+                              expected_success, stdin, actual_stdout,
+                              expected_stdout, empty_error,
+                              timer, actual_exitcode, self.__str_divergence(other.divergence) + ", program was stopped.", categories = categories)
+
 		if not expected_success and actual_success:
 			return results.TestResult(False, name, expected_success, stdin, actual_stdout, expected_stdout, expected_success != True, timer, actual_exitcode, "Program returns ERROR_CODE = 0.")
 
@@ -94,8 +131,21 @@ class Expected:
                              timer, actual_exitcode, categories = categories
             )
 
+		# Golden tests receive verdict from GoldenSink instead of full output.
+		if self.golden is not None:
+			if other.divergence is not None:
+				print("====> FAILING \"%s\"... STDERR:\n\"\"\"\n%s\"\"\"" % (name, actual_stderr), file = sys.stderr)
+				return results.TestResult(False, name,
+                              expected_success, stdin, actual_stdout,
+                              expected_stdout, empty_error,
+                              timer, actual_exitcode, self.__str_divergence(other.divergence) + ".", categories = categories)
+			return results.TestResult(True, name,
+                              expected_success, stdin, actual_stdout,
+                              expected_stdout, empty_error,
+                              timer, actual_exitcode, categories = categories)
+
+		# Hard tests receive SHA-256 of output from Sha256Sink instead of output.
 		if expected_sha256:
-			actual_stdout = hashlib.sha256(actual_stdout.encode("utf-8")).hexdigest()
 			if actual_stdout != expected_stdout:
 				return results.TestResult(False, name,
                               expected_success, stdin, actual_stdout,
@@ -107,11 +157,25 @@ class Expected:
                               expected_stdout, empty_error,
                               timer, actual_exitcode, categories = categories)
 
+		# Large output has been compared by TextSink, only its preview is left.
+		if other.divergence is not None:
+			print("====> FAILING \"%s\"... STDERR:\n\"\"\"\n%s\"\"\"" % (name, actual_stderr), file = sys.stderr)
+			return results.TestResult(False, name,
+                              expected_success, stdin, actual_stdout,
+                              expected_stdout, empty_error,
+                              timer, actual_exitcode, self.__str_divergence(other.divergence) + ".", categories = categories)
+
 		ok, err = self.__compare_impl(actual_stdout, expected_stdout, self.show_diff)
 		if not ok:
 			print("====> FAILING \"%s\"... STDERR:\n\"\"\"\n%s\"\"\"" % (name, actual_stderr), file = sys.stderr)
 		return results.TestResult(ok, name, expected_success, stdin, actual_stdout, expected_stdout, empty_error, timer, actual_exitcode, err, categories)
 
 class Actual(Expected):
-	def __init__(self, stdout: str, stderr: str, exitcode: int):
-		Expected.__init__(self, stdout = stdout, stderr = stderr, is_success = (exitcode == config.EXIT_SUCCESS), exitcode = exitcode)
+	def __init__(self, stdout: str, stderr: str, exitcode: int, is_sha256: bool = False, divergence: int = None, output_limit: int = None, stopped: bool = False, limit: str = None, verdict: process.Status = None):
+		Expected.__init__(self, stdout = stdout, stderr = stderr, is_success = (exitcode == config.EXIT_SUCCESS), is_sha256 = is_sha256, exitcode = exitcode)
+		self.divergence = divergence
+		self.stopped = stopped
+		self.output_limit = output_limit
+		# Description of resource limit the program has run into.
+		self.limit = limit
+		self.verdict = verdict
@@ -0,0 +1,473 @@
+import asyncio
+import collections
+import copy
+import csv
+import itertools
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import CancelledError, Executor, Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, Iterator, List, Tuple
+
+from suite import bench
+from suite import config
+from suite import store
+from suite import tools
+
+# Batch grading and scheduling.
+
+# Passes outcome of task run by inner executor to future given out to caller.
+def _forward(inner: Future, future: Future):
+	if inner.cancelled():
+		future.set_exception(CancelledError())
+	elif inner.exception() is not None:
+		future.set_exception(inner.exception())
+	else:
+		future.set_result(inner.result())
+
+# Passes at most limit tasks at once to shared executor, the rest wait here in order.
+# Every submission gets its own one, so a single submission cannot take the whole pool.
+class BoundedExecutor(Executor):
+	def __init__(self, executor: Executor, limit: int = None):
+		self.executor = executor
+		self.limit = limit
+		self.lock = threading.Lock()
+		self.running = 0
+		self.queue: Deque[Tuple[Future, Callable, tuple, dict]] = collections.deque()
+
+	def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+		if self.limit is None:
+			return self.executor.submit(fn, *args, **kwargs)
+		future = Future()
+		with self.lock:
+			self.queue.append((future, fn, args, kwargs))
+		self.__dispatch()
+		return future
+
+	def __dispatch(self):
+		while True:
+			with self.lock:
+				if self.running >= self.limit or len(self.queue) == 0:
+					return
+				future, fn, args, kwargs = self.queue.popleft()
+				self.running += 1
+			if not future.set_running_or_notify_cancel():
+				with self.lock:
+					self.running -= 1
+				continue
+			inner = self.executor.submit(fn, *args, **kwargs)
+			inner.add_done_callback(lambda inner, future = future: self.__done(inner, future))
+
+	def __done(self, inner: Future, future: Future):
+		with self.lock:
+			self.running -= 1
+		_forward(inner, future)
+		self.__dispatch()
+
+# Keeps submitted tasks until flush and then passes them to executor longest first (LPT),
+# which keeps slow tests from stretching the end of the run. Tasks without estimate
+# may be slow as well, so they go first, in order of submission.
+class LongestFirst(Executor):
+	def __init__(self, executor: Executor):
+		self.executor = executor
+		self.tasks: List[Tuple[Future, Callable, tuple, dict]] = []
+		self.estimates: List[float] = []
+
+	def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+		return self.submit_estimated(None, fn, *args, **kwargs)
+
+	def submit_estimated(self, estimate: float, fn: Callable, /, *args, **kwargs) -> Future:
+		future = Future()
+		self.tasks.append((future, fn, args, kwargs))
+		self.estimates.append(estimate)
+		return future
+
+	def flush(self):
+		tasks = [self.tasks[i] for i in tools.longest_first(self.estimates, lambda estimate: estimate)]
+		self.tasks = []
+		self.estimates = []
+		for future, fn, args, kwargs in tasks:
+			if not future.set_running_or_notify_cancel():
+				continue
+			inner = self.executor.submit(fn, *args, **kwargs)
+			inner.add_done_callback(lambda inner, future = future: _forward(inner, future))
+
+# Time from the first start to the last finish of tasks run through it. Categories share
+# one pool, so time of category is its own span instead of time since the whole run started.
+# Runs timed by span are timed by its parent as well, so span of suite covers its categories.
+class Span:
+	def __init__(self, parent: 'Span' = None):
+		self.parent = parent
+		self.lock = threading.Lock()
+		self.start: int = None
+		self.end: int = None
+
+	def __record(self, start: int, end: int):
+		with self.lock:
+			self.start = start if self.start is None else min(self.start, start)
+			self.end = end if self.end is None else max(self.end, end)
+		if self.parent is not None:
+			self.parent.__record(start, end)
+
+	def run(self, fn: Callable, /, *args, **kwargs) -> Any:
+		start = time.monotonic_ns()
+		try:
+			return fn(*args, **kwargs)
+		finally:
+			self.__record(start, time.monotonic_ns())
+
+	# Coroutine is timed from when it is awaited, so inside of tools.run_bounded waiting for
+	# semaphore is left out.
+	async def run_async(self, coroutine: Awaitable) -> Any:
+		start = time.monotonic_ns()
+		try:
+			return await coroutine
+		finally:
+			self.__record(start, time.monotonic_ns())
+
+	# Milliseconds from the first start to the last finish, 0 if nothing has run.
+	def timer(self) -> int:
+		if self.start is None:
+			return 0
+		return (self.end - self.start) // 1000000
+
+# What running tests of one category needs besides workers, cache, plan, history and runs
+# can be None. Tests run are timed by span.
+class RunContext:
+	def __init__(self, cache: store.ResultCache = None, plan: bench.Plan = None, history: store.TimingHistory = None, runs: store.RunStore = None, span: Span = None):
+		self.cache = cache
+		self.plan = plan
+		self.history = history
+		self.runs = runs
+		self.span = Span() if span is None else span
+
+	# Context of one category of this run, timed by its own span within span of this run.
+	def fork(self) -> 'RunContext':
+		return RunContext(self.cache, self.plan, self.history, self.runs, Span(self.span))
+
+	def save(self):
+		if self.history is not None:
+			self.history.save()
+		if self.runs is not None:
+			self.runs.save()
+
+# Tests made on demand from (input, expected) pairs, so suite of millions of inputs is
+# never held in memory. Pairs are given by function called on every run, categories are
+# those of every test made. Source made once (from iterator) can be iterated only once,
+# another run would silently get no tests from it.
+class TestSource:
+	def __init__(self, pairs: Callable[[], Iterable[Tuple[Any, Any]]], make: Callable[[Any, Any], Any], categories: Iterable[str], once: bool = False):
+		self.pairs = pairs
+		self.make = make
+		self.categories = categories
+		self.once = once
+		self.used = False
+
+	def __iter__(self) -> Iterator[Any]:
+		if self.once and self.used:
+			raise ValueError("Tests added from iterable have been run already, add them by generator to run them again.")
+		self.used = True
+		for input, expected in self.pairs():
+			yield self.make(input, expected)
+
+# Whether all tests of testers can be run more than once (see TestSource).
+def reusable(testers: List[Any]) -> bool:
+	return not any(source.once for tester in testers for source in tester.sources)
+
+# Positions (counted over all sources) and tests for which select(position, test) holds.
+def generate(sources: List[TestSource], select: Callable[[int, Any], bool] = None) -> Iterator[Tuple[int, Any]]:
+	for position, test in enumerate(itertools.chain.from_iterable(sources)):
+		if select is None or select(position, test):
+			yield position, test
+
+# Runs fn on tests with at most window of them started and not yet taken by caller, so
+# only those are held in memory. The first window is started right away, so tests run
+# while caller still waits for others, then next test is started whenever caller takes
+# one. Gives (position, test, future) in order of tests.
+def stream(executor: Executor, fn: Callable[[Any], Any], tests: Iterable[Tuple[int, Any]], window: int) -> Iterator[Tuple[int, Any, Future]]:
+	tests = iter(tests)
+	pending: Deque[Tuple[int, Any, Future]] = collections.deque()
+	def fill():
+		for position, test in itertools.islice(tests, window - len(pending)):
+			pending.append((position, test, executor.submit(fn, test)))
+	def drain() -> Iterator[Tuple[int, Any, Future]]:
+		while len(pending) > 0:
+			yield pending.popleft()
+			fill()
+	fill()
+	return drain()
+
+def stream_async(start: Callable[[Any], Awaitable], tests: Iterable[Tuple[int, Any]], window: int) -> AsyncIterator[Tuple[int, Any, asyncio.Future]]:
+	tests = iter(tests)
+	pending: Deque[Tuple[int, Any, asyncio.Future]] = collections.deque()
+	def fill():
+		for position, test in itertools.islice(tests, window - len(pending)):
+			pending.append((position, test, asyncio.ensure_future(start(test))))
+	async def drain() -> AsyncIterator[Tuple[int, Any, asyncio.Future]]:
+		try:
+			while len(pending) > 0:
+				yield pending.popleft()
+				fill()
+		finally:
+			tools.cancel_tasks([task for _, _, task in pending])
+	fill()
+	return drain()
+
+# Every count-th generated test starting from index, remembers how many tests it has seen.
+class RoundRobin:
+	def __init__(self, index: int, count: int):
+		self.index = index
+		self.count = count
+		self.seen = 0
+
+	def __call__(self, position: int, test: Any) -> bool:
+		self.seen = position + 1
+		return position % self.count == self.index
+
+# Shard of every item for count shards, balanced by estimated times: items go longest
+# first to the least loaded shard (lowest index on ties). Items without estimate weigh
+# as mean of known ones, so without any history items are dealt round robin. Result
+# depends only on estimates, so every node computes the same partition.
+def partition(estimates: List[float], count: int) -> List[int]:
+	if count < 1:
+		raise ValueError("There should be at least one shard.")
+	known = [estimate for estimate in estimates if estimate is not None]
+	default = statistics.fmean(known) if len(known) > 0 else 1.0
+	weights = [default if estimate is None else estimate for estimate in estimates]
+	loads = [0.0] * count
+	shards = [0] * len(weights)
+	for i in tools.longest_first(weights, lambda weight: weight):
+		shards[i] = min(range(count), key = lambda shard: loads[shard])
+		loads[shards[i]] += weights[i]
+	return shards
+
+# Copies of testers (anything with category and tests) with only tests of shard index,
+# together with positions of those tests within their testers.
+def shard(testers: List[Any], index: int, count: int, estimate: Callable[[Any, Any], float] = None) -> Tuple[List[Any], List[List[int]]]:
+	if not 0 <= index < count:
+		raise ValueError("Shard index should be in range from 0 to %d." % (count - 1))
+	shards = iter(partition([None if estimate is None else estimate(tester, test) for tester in testers for test in tester.tests], count))
+	sharded = []
+	positions = []
+	for tester in testers:
+		new_tester = copy.copy(tester)
+		new_tester.tests = []
+		positions.append([])
+		for i, test in enumerate(tester.tests):
+			if next(shards) == index:
+				new_tester.tests.append(test)
+				positions[-1].append(i)
+		sharded.append(new_tester)
+	return sharded, positions
+
+# Joins results of all shards of one run into (name, results, timers of shards) per
+# category in declaration order.
+def merge(shards: List[store.ShardResult]) -> List[Tuple[str, List[Any], List[int]]]:
+	if len(shards) == 0:
+		raise ValueError("There should be at least one shard to merge.")
+	count = shards[0].count
+	if sorted(shard.index for shard in shards) != list(range(count)) or any(shard.count != count for shard in shards):
+		raise ValueError("Every one of %d shards should be merged exactly once." % (count))
+	suite = [category[:2] for category in shards[0].categories]
+	if any([category[:2] for category in shard.categories] != suite for shard in shards):
+		raise ValueError("Shards have been run with different suites.")
+	merged = []
+	for k, (name, size) in enumerate(suite):
+		placed = sorted(((position, result) for shard in shards for position, result in zip(shard.categories[k][2], shard.categories[k][3])), key = lambda pair: pair[0])
+		if [position for position, _ in placed] != list(range(size)):
+			raise ValueError("Shards have been partitioned differently, every test should be run by exactly one shard.")
+		merged.append((name, [result for _, result in placed], [shard.categories[k][4] for shard in shards]))
+	return merged
+
+# Results of every submission by its executable. Each result should provide to_dict()
+# with passed, total, timer and categories (list of dicts with the same counters).
+class MatrixResult:
+	def __init__(self, results: Dict[str, Any]):
+		self.results = results
+
+	def to_dict(self) -> Dict[str, Dict[str, Any]]:
+		return {filename: result.to_dict() for filename, result in self.results.items()}
+
+	def write_json(self, filename: str):
+		with open(filename, "w") as file:
+			json.dump(self.to_dict(), file, indent = 2)
+
+	# One row per submission with totals followed by passed/total of every category.
+	def write_csv(self, filename: str):
+		rows = self.to_dict()
+		categories: List[str] = []
+		for row in rows.values():
+			for category in row["categories"]:
+				if category["category"] not in categories:
+					categories.append(category["category"])
+		with open(filename, "w", newline = "") as file:
+			writer = csv.writer(file)
+			header = ["submission", "passed", "total", "timer"]
+			for category in categories:
+				header += ["%s passed" % (category), "%s total" % (category)]
+			writer.writerow(header)
+			for submission, row in rows.items():
+				counts = {category["category"]: category for category in row["categories"]}
+				line = [submission, row["passed"], row["total"], row["timer"]]
+				for category in categories:
+					count = counts.get(category)
+					line += [None, None] if count is None else [count["passed"], count["total"]]
+				writer.writerow(line)
+
+# Categories run in one pool of jobs workers, so a slow category does not hold back the
+# others. With history, tests known to be slow are started first across all categories,
+# results keep declaration order. Generated tests of every category are started before
+# any category is collected.
+def run_testers(testers: List[Any], jobs: int, context: RunContext) -> List[Any]:
+	contexts = [context.fork() for _ in testers]
+	with ThreadPoolExecutor(max_workers = jobs) as executor:
+		scheduler = LongestFirst(executor)
+		futures = [tester.submit(scheduler, own) for tester, own in zip(testers, contexts)]
+		scheduler.flush()
+		streams = [tester.stream(executor, jobs, own) for tester, own in zip(testers, contexts)]
+		try:
+			categories = [tester.collect(submitted, own, generated) for tester, submitted, own, generated in zip(testers, futures, contexts, streams)]
+		except SystemExit:
+			executor.shutdown(cancel_futures = True)
+			raise
+	context.save()
+	return categories
+
+# With history, slow tests are started first within each category.
+async def run_testers_async(testers: List[Any], jobs: int, context: RunContext) -> List[Any]:
+	semaphore = asyncio.Semaphore(jobs)
+	contexts = [context.fork() for _ in testers]
+	tasks = [tester.schedule(semaphore, own) for tester, own in zip(testers, contexts)]
+	streams = [tester.stream_async(semaphore, jobs, own) for tester, own in zip(testers, contexts)]
+	try:
+		categories = [await tester.collect_async(scheduled, own, generated) for tester, scheduled, own, generated in zip(testers, tasks, contexts, streams)]
+	finally:
+		for scheduled in tasks:
+			tools.cancel_tasks(scheduled)
+	context.save()
+	return categories
+
+# Running of one category shared by testers of both families. Tester has category,
+# filename, executable, tests, sources and select, and runs its tests by submit, stream
+# and collect (schedule, stream_async and collect_async with asyncio), each given
+# RunContext of the category.
+class Runs:
+	def is_empty(self) -> bool:
+		return len(self.tests) == 0 and len(self.sources) == 0
+
+	# Same tests for another executable, tests themselves are shared.
+	def for_executable(self, filename: str) -> Any:
+		new_tester = copy.copy(self)
+		new_tester.filename = filename
+		new_tester.executable = os.path.abspath(filename)
+		return new_tester
+
+	# Generated tests are run after declared ones.
+	def run(self, jobs: int = config.DEFAULT_JOBS, cache: store.ResultCache = None, plan: bench.Plan = None, history: store.TimingHistory = None, runs: store.RunStore = None) -> Any:
+		return run_testers([self], jobs, RunContext(cache, plan, history, runs))[0]
+
+	async def run_async(self, jobs: int = config.DEFAULT_JOBS, cache: store.ResultCache = None, plan: bench.Plan = None, history: store.TimingHistory = None, runs: store.RunStore = None) -> Any:
+		return (await run_testers_async([self], jobs, RunContext(cache, plan, history, runs)))[0]
+
+	# Every test is benchmarked one at a time, so runs do not compete for CPU.
+	def benchmark(self, warmup: int = config.DEFAULT_WARMUP, repeat: int = config.DEFAULT_REPEAT) -> Any:
+		return self.run(1, None, bench.Plan(warmup, repeat))
+
+	# Runs again only tests which have not passed when executable was run last time.
+	def rerun_failed(self, runs: store.RunStore, jobs: int = config.DEFAULT_JOBS, cache: store.ResultCache = None, plan: bench.Plan = None, history: store.TimingHistory = None) -> Any:
+		return self.failed_only(runs).run(jobs, cache, plan, history, runs)
+
+	# Tests which failed last time or have never been run.
+	def failed_only(self, runs: store.RunStore) -> Any:
+		passed = runs.passed(self.filename, self.category)
+		new_tester = copy.copy(self)
+		new_tester.tests = [test for test in self.tests if store.test_key(self.category, test) not in passed]
+		new_tester.select = lambda position, test: store.test_key(self.category, test) not in passed
+		return new_tester
+
+# Running of whole suite shared by suites of both families. Suite has testers (see Runs),
+# makes its result by _result from results of categories and time of the suite in
+# milliseconds (span of its tests), and gives results of tests of category by _tests.
+class SuiteRuns:
+	def _result(self, categories: List[Any], timer: int) -> Any:
+		raise NotImplementedError
+
+	def _tests(self, category: Any) -> List[Any]:
+		raise NotImplementedError
+
+	def __with(self, testers: List[Any]) -> Any:
+		suite = copy.copy(self)
+		suite.testers = testers
+		return suite
+
+	# With history, tests known to be slow are started first across all categories
+	# (within each category for async run), results keep declaration order.
+	def run(self, jobs: int = config.DEFAULT_JOBS, cache: store.ResultCache = None, plan: bench.Plan = None, history: store.TimingHistory = None, runs: store.RunStore = None) -> Any:
+		context = RunContext(cache, plan, history, runs)
+		return self._result(run_testers(self.testers, jobs, context), context.span.timer())
+
+	async def run_async(self, jobs: int = config.DEFAULT_JOBS, cache: store.ResultCache = None, plan: bench.Plan = None, history: store.TimingHistory = None, runs: store.RunStore = None) -> Any:
+		context = RunContext(cache, plan, history, runs)
+		return self._result(await run_testers_async(self.testers, jobs, context), context.span.timer())
+
+	# Every test is benchmarked one at a time, so runs do not compete for CPU.
+	def benchmark(self, warmup: int = config.DEFAULT_WARMUP, repeat: int = config.DEFAULT_REPEAT) -> Any:
+		return self.run(1, None, bench.Plan(warmup, repeat))
+
+	# Runs again only tests which have not passed when executable was run last time,
+	# categories without such tests are left out.
+	def rerun_failed(self, runs: store.RunStore, jobs: int = config.DEFAULT_JOBS, cache: store.ResultCache = None, plan: bench.Plan = None, history: store.TimingHistory = None) -> Any:
+		failed = self.__with([tester for tester in (tester.failed_only(runs) for tester in self.testers) if not tester.is_empty()])
+		return failed.run(jobs, cache, plan, history, runs)
+
+	# Runs only tests of shard index out of count (see partition) and writes their results
+	# to filename, results of all shards are joined by merge of result of the suite.
+	# Every node should have the same suite and history for partitions to agree, so history
+	# is only read here: timings saved by one shard would move tests of shards run after it.
+	def run_shard(self, index: int, count: int, filename: str, jobs: int = config.DEFAULT_JOBS, cache: store.ResultCache = None, plan: bench.Plan = None, history: store.TimingHistory = None, runs: store.RunStore = None) -> Any:
+		estimate = None if history is None else lambda tester, test: history.estimate(tester.category, test)
+		testers, positions = shard(self.testers, index, count, estimate)
+		# Generated tests are dealt round robin, as their timings are not known ahead.
+		for tester in testers:
+			tester.select = RoundRobin(index, count)
+		context = RunContext(cache, plan, None, runs)
+		categories = run_testers(testers, jobs, context)
+		shards = []
+		for tester, sharded, category, tests in zip(self.testers, testers, categories, positions):
+			tests += [len(tester.tests) + position for position in range(index, sharded.select.seen, count)]
+			shards.append((tester.category, len(tester.tests) + sharded.select.seen, tests, self._tests(category), category.timer))
+		store.ShardResult(index, count, shards, context.span.timer()).save(filename)
+		return self._result(categories, context.span.timer())
+
+	# Grades every executable with the same testers. All (submission, test) pairs share one
+	# pool of jobs workers, each submission has at most jobs_per_submission tests running.
+	# Results are reported submission by submission in the given order. Time of submission
+	# is span of its tests, so waiting for workers taken by other submissions before its
+	# first test starts is left out. Tests added from iterable can be run only once, so they
+	# are refused for more than one submission.
+	def run_matrix(self, filenames: List[str], jobs: int = config.DEFAULT_JOBS, jobs_per_submission: int = None, cache: store.ResultCache = None) -> 'MatrixResult':
+		filenames = list(dict.fromkeys(filenames))
+		if len(filenames) > 1 and not reusable(self.testers):
+			raise ValueError("Tests added from iterable can grade only one submission, add them by generator.")
+		graded: Dict[str, Any] = {}
+		with ThreadPoolExecutor(max_workers = jobs) as executor:
+			pending = []
+			for filename in filenames:
+				bounded = BoundedExecutor(executor, jobs_per_submission)
+				testers = [tester.for_executable(filename) for tester in self.testers]
+				context = RunContext(cache)
+				contexts = [context.fork() for _ in testers]
+				futures = [tester.submit(bounded, own) for tester, own in zip(testers, contexts)]
+				streams = [tester.stream(bounded, jobs_per_submission or jobs, own) for tester, own in zip(testers, contexts)]
+				pending.append((filename, context, list(zip(testers, futures, contexts, streams))))
+			try:
+				for filename, context, submitted in pending:
+					print("=> Submission: %s." % (filename))
+					categories = [tester.collect(futures, own, generated) for tester, futures, own, generated in submitted]
+					graded[filename] = self._result(categories, context.span.timer())
+			except SystemExit:
+				executor.shutdown(cancel_futures = True)
+				raise
+		return MatrixResult(graded)
@@ -0,0 +1,201 @@
+import math
+import re
+import statistics
+from typing import Awaitable, Callable, Dict, List, Tuple, TypeVar
+
+from suite import config
+from suite import process
+
+# Benchmarks.
+
+T = TypeVar("T")
+
+# Order statistics and spread of timing samples, all values are in microseconds.
+class Stats:
+	def __init__(self, samples: List[int]):
+		self.samples = sorted(samples)
+		self.min = self.samples[0]
+		self.median = statistics.median(self.samples)
+		# Nearest-rank percentile, so it is always one of the samples.
+		self.p95 = self.samples[math.ceil(0.95 * len(self.samples)) - 1]
+		self.stddev = statistics.stdev(self.samples) if len(self.samples) > 1 else 0.0
+
+	def __str__(self) -> str:
+		return "min %.3f ms, median %.3f ms, p95 %.3f ms, stddev %.3f ms" % (self.min / 1000, self.median / 1000, self.p95 / 1000, self.stddev / 1000)
+
+	def envs(self, prefix: str) -> str:
+		return "%s_MIN_US=%d\n%s_MEDIAN_US=%d\n%s_P95_US=%d\n%s_STDDEV_US=%d\n" % (prefix, self.min, prefix, self.median, prefix, self.p95, prefix, self.stddev)
+
+# Wall and CPU time statistics over measured runs of one test. CPU time is known
+# only if every run has it (see process.Usage).
+class Benchmark:
+	def __init__(self, usages: List[process.Usage]):
+		self.runs = len(usages)
+		self.wall = Stats([usage.wall_us for usage in usages])
+		self.cpu: Stats = None
+		if all(usage.user_us is not None for usage in usages):
+			self.cpu = Stats([usage.cpu_us() for usage in usages])
+
+	def __str__(self) -> str:
+		text = "%d runs, wall: %s" % (self.runs, self.wall)
+		if self.cpu is not None:
+			text += "; CPU: %s" % (self.cpu)
+		return text
+
+	# Median CPU time if it is measured (it is less noisy), otherwise median wall time.
+	def typical(self) -> float:
+		return (self.cpu or self.wall).median
+
+	def envs(self, prefix: str) -> str:
+		envs = "%s_RUNS=%d\n" % (prefix, self.runs) + self.wall.envs(prefix + "_WALL")
+		if self.cpu is not None:
+			envs += self.cpu.envs(prefix + "_CPU")
+		return envs
+
+# Upper bounds for timing statistics in milliseconds, None means unbounded.
+class Budget:
+	def __init__(self, median_ms: float = None, p95_ms: float = None, min_ms: float = None, cpu: bool = False):
+		self.median_ms = median_ms
+		self.p95_ms = p95_ms
+		self.min_ms = min_ms
+		# Bounds apply to CPU time instead of wall time.
+		self.cpu = cpu
+
+	# Returns description of first exceeded bound or None if benchmark fits.
+	def check(self, benchmark: Benchmark) -> str:
+		clock = "CPU" if self.cpu else "wall"
+		stats = benchmark.cpu if self.cpu else benchmark.wall
+		if stats is None:
+			return "%s time is not measured" % (clock)
+		for statistic, bound in (("median", self.median_ms), ("p95", self.p95_ms), ("min", self.min_ms)):
+			value = getattr(stats, statistic) / 1000
+			if bound is not None and value > bound:
+				return "%s %s time is %.3f ms, but should be under %g ms" % (statistic, clock, value, bound)
+		return None
+
+# How test is benchmarked: warmup runs are thrown away, repeat runs are measured.
+class Plan:
+	def __init__(self, warmup: int = config.DEFAULT_WARMUP, repeat: int = config.DEFAULT_REPEAT, budget: Budget = None):
+		if repeat < 1:
+			raise ValueError("Benchmark should have at least one measured run.")
+		self.warmup = warmup
+		self.repeat = repeat
+		self.budget = budget
+
+	# Runs are sequential, so they do not compete with each other. Stops at first failed
+	# run and returns it, otherwise returns last run, with statistics of measured runs
+	# done so far (None if there are none).
+	def run(self, once: Callable[[], T], usage: Callable[[T], process.Usage], failed: Callable[[T], bool]) -> Tuple[T, Benchmark]:
+		for _ in range(self.warmup):
+			outcome = once()
+			if failed(outcome):
+				return outcome, None
+		usages = []
+		for _ in range(self.repeat):
+			outcome = once()
+			if usage(outcome) is not None:
+				usages.append(usage(outcome))
+			if failed(outcome):
+				break
+		return outcome, Benchmark(usages) if len(usages) > 0 else None
+
+	async def run_async(self, once: Callable[[], Awaitable[T]], usage: Callable[[T], process.Usage], failed: Callable[[T], bool]) -> Tuple[T, Benchmark]:
+		for _ in range(self.warmup):
+			outcome = await once()
+			if failed(outcome):
+				return outcome, None
+		usages = []
+		for _ in range(self.repeat):
+			outcome = await once()
+			if usage(outcome) is not None:
+				usages.append(usage(outcome))
+			if failed(outcome):
+				break
+		return outcome, Benchmark(usages) if len(usages) > 0 else None
+
+# Candidate complexity curves, from slowest growing to fastest.
+COMPLEXITIES: Dict[str, Callable[[float], float]] = {
+	"1": lambda n: 1.0,
+	"log n": lambda n: math.log2(n),
+	"n": lambda n: n,
+	"n log n": lambda n: n * math.log2(n),
+	"n^2": lambda n: n ** 2,
+	"n^3": lambda n: n ** 3,
+	"2^n": lambda n: 2.0 ** n,
+}
+
+# Time as intercept + coefficient * curve(n), intercept absorbs start up of program.
+class Fit:
+	def __init__(self, complexity: str, coefficient: float, intercept: float, error: float):
+		self.complexity = complexity
+		self.coefficient = coefficient
+		self.intercept = intercept
+		# Root mean square of relative errors.
+		self.error = error
+
+	# Time (in microseconds) predicted at size.
+	def at(self, size: int) -> float:
+		return self.intercept + self.coefficient * COMPLEXITIES[self.complexity](size)
+
+	def __str__(self) -> str:
+		return "O(%s): %.3g us * %s + %.3f ms, rms error %.1f%%" % (self.complexity, self.coefficient, self.complexity, self.intercept / 1000, self.error * 100)
+
+	# Whether fitted curve grows no faster than expected one.
+	def fits(self, expected: str) -> bool:
+		order = list(COMPLEXITIES)
+		return order.index(self.complexity) <= order.index(expected)
+
+# None when curve is too steep for sizes (2^n) or log of size is below 1.
+def _fit_curve(complexity: str, sizes: List[int], times: List[float]) -> Fit:
+	try:
+		return _fit_weighted(complexity, [COMPLEXITIES[complexity](size) for size in sizes], times)
+	except (OverflowError, ValueError):
+		return None
+
+# Weighted by 1 / time^2, so error is relative and every size counts the same:
+# timing noise grows with time, and largest size would outweigh the rest otherwise.
+def _fit_weighted(complexity: str, xs: List[float], times: List[float]) -> Fit:
+	weights = [1 / max(t, 1) ** 2 for t in times]
+	total = sum(weights)
+	mean_x = sum(w * x for w, x in zip(weights, xs)) / total
+	mean_t = sum(w * t for w, t in zip(weights, times)) / total
+	variance = sum(w * (x - mean_x) ** 2 for w, x in zip(weights, xs))
+	coefficient = 0.0
+	if variance > 0:
+		coefficient = max(0.0, sum(w * (x - mean_x) * (t - mean_t) for w, x, t in zip(weights, xs, times)) / variance)
+	intercept = mean_t - coefficient * mean_x
+	# Negative start up time makes no sense, such curve is fitted through origin instead.
+	if intercept < 0:
+		coefficient = sum(w * x * t for w, x, t in zip(weights, xs, times)) / sum(w * x * x for w, x in zip(weights, xs))
+		intercept = 0.0
+	error = math.sqrt(statistics.fmean([w * (intercept + coefficient * x - t) ** 2 for w, x, t in zip(weights, xs, times)]))
+	return Fit(complexity, coefficient, intercept, error)
+
+# Sizes should allow a fit: at least three different ones, all positive (log n of 0).
+def check_sizes(sizes: List[int]):
+	if len(set(sizes)) < 3:
+		raise ValueError("Complexity fit needs at least three different sizes.")
+	if any(size < 1 for size in sizes):
+		raise ValueError("Sizes of complexity fit should be at least 1.")
+
+# Least squares fit of times (in microseconds) measured at sizes against every candidate.
+# Faster growing curve is chosen only if it reduces error by config.SCALING_TOLERANCE,
+# so noise does not turn linear program into n log n one, and only if it grows by
+# config.SCALING_MIN_GROWTH over sizes, so noisy flat times stay O(1).
+def fit(sizes: List[int], times: List[float]) -> Fit:
+	check_sizes(sizes)
+	smallest, largest = min(sizes), max(sizes)
+	best: Fit = None
+	for complexity in COMPLEXITIES:
+		candidate = _fit_curve(complexity, sizes, times)
+		if candidate is None:
+			continue
+		if best is not None and candidate.at(largest) < candidate.at(smallest) * (1 + config.SCALING_MIN_GROWTH):
+			continue
+		if best is None or candidate.error < best.error * (1 - config.SCALING_TOLERANCE):
+			best = candidate
+	return best
+
+# Name of test turned into shell variable name.
+def env_name(name: str) -> str:
+	return re.sub(r"\W", "_", name).upper()
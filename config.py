@@ -1,9 +1,58 @@
+import os
+import sys
+
 # Suite tester exitcode.
 EXIT_SUCCESS = 0
 EXIT_FAILURE = 1
 
-# Timeouts.
+# Timeouts, and seconds that process group of timed out program is given between
+# SIGTERM and SIGKILL.
 DEFAULT_TIMEOUT = 1
+KILL_GRACE = 0.1
+
+# Output capture: hard limit per stream, size kept in memory before spilling
+# to a temporary file, and length of output preview kept in results.
+DEFAULT_MAX_OUTPUT_BYTES = 256 * 1024 * 1024
+SPILL_THRESHOLD = 1024 * 1024
+PREVIEW_LENGTH = 4096
+
+# Diff of failed output: context lines around changes, hunks shown, and lines of both
+# outputs diffed in full, larger outputs show only first differing lines.
+DIFF_CONTEXT = 3
+DIFF_MAX_HUNKS = 10
+DIFF_MAX_LINES = 2000
+DIFF_FIRST_LINES = 20
+
+# Widest column of result table, None means as wide as its longest cell.
+MAX_COLUMN_WIDTH = None
+
+# Share of memory limit that run crashed by SIGSEGV or SIGABRT (without allocation
+# error on error output) should reach by peak RSS to be reported as memory limit breach.
+MEMORY_LIMIT_RATIO = 0.5
+
+# Result cache size on disk.
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+# Benchmarks: runs thrown away before measuring and measured runs.
+DEFAULT_WARMUP = 1
+DEFAULT_REPEAT = 5
+
+# Share of fit error that faster growing complexity curve should win to be chosen, and
+# share by which its time should grow from the smallest size to the largest one.
+SCALING_TOLERANCE = 0.1
+SCALING_MIN_GROWTH = 0.25
+
+# Weight of the latest run in timing history of test.
+HISTORY_SMOOTHING = 0.5
+
+# Programs are started by os.posix_spawn instead of subprocess.Popen. It pays
+# off where Popen forks (macOS), on Linux Popen uses vfork already and is as fast.
+POSIX_SPAWN = sys.platform == "darwin"
+
+# Parallelism.
+DEFAULT_JOBS = os.cpu_count() or 1
+# Generated tests started ahead per worker, so workers do not wait for slow test reported first.
+STREAM_WINDOW_PER_JOB = 2
 
 # C/C++ return codes.
 ERROR_SUCCESS = 0
@@ -0,0 +1,128 @@
+import difflib
+import itertools
+from typing import Dict, Iterator, List, Tuple
+
+from suite import config
+
+# Line diffs of outputs.
+
+Opcode = Tuple[str, int, int, int, int]
+
+# Lines turned into ids, equal lines of both outputs share one, so lines are hashed
+# once and matched by comparing ints.
+def _ids(lines: List[str], table: Dict[str, int]) -> List[int]:
+	return [table.setdefault(line, len(table)) for line in lines]
+
+# Lengths of common start and common end of a and b, end does not overlap start.
+def _common(a: List[int], b: List[int]) -> Tuple[int, int]:
+	shorter = min(len(a), len(b))
+	start = 0
+	while start < shorter and a[start] == b[start]:
+		start += 1
+	end = 0
+	while end < shorter - start and a[-1 - end] == b[-1 - end]:
+		end += 1
+	return start, end
+
+# Offsets (from 0) of differing lines when lines at the same offset are compared.
+def _differing(a: List[int], b: List[int]) -> Iterator[int]:
+	for k in range(max(len(a), len(b))):
+		if k >= len(a) or k >= len(b) or a[k] != b[k]:
+			yield k
+
+# Opcodes of lines at the same offset, covering them up to first count differing lines.
+def _aligned(a: List[int], b: List[int], count: int) -> List[Opcode]:
+	opcodes: List[Opcode] = []
+	last = 0
+	for k in itertools.islice(_differing(a, b), count):
+		if k > last:
+			opcodes.append(("equal", last, k, last, k))
+		i1, j1 = min(k, len(a)), min(k, len(b))
+		if len(opcodes) > 0 and opcodes[-1][0] == "replace" and opcodes[-1][2] == i1 and opcodes[-1][4] == j1:
+			i1, j1 = opcodes.pop()[1::2]
+		opcodes.append(("replace", i1, min(k + 1, len(a)), j1, min(k + 1, len(b))))
+		last = k + 1
+	return opcodes
+
+# Opcodes of difflib on ids if there are at most max_lines lines, so diff is exactly that of
+# difflib. Otherwise only lines between common start and end are matched, first
+# first_lines differing lines at the same offset. Gives opcodes over whole outputs and
+# number of differing lines left out.
+def _opcodes(a: List[int], b: List[int], max_lines: int, first_lines: int) -> Tuple[List[Opcode], int]:
+	if len(a) + len(b) <= max_lines:
+		return difflib.SequenceMatcher(None, a, b).get_opcodes(), 0
+	start, end = _common(a, b)
+	middle_a = a[start:len(a) - end]
+	middle_b = b[start:len(b) - end]
+	opcodes = _aligned(middle_a, middle_b, first_lines)
+	left_out = max(sum(1 for _ in _differing(middle_a, middle_b)) - first_lines, 0)
+	# Without differing lines left out, the rest of both is equal.
+	last = opcodes[-1][2] if len(opcodes) > 0 else 0
+	if left_out == 0 and last < len(middle_a):
+		opcodes.append(("equal", last, len(middle_a), last, len(middle_b)))
+	opcodes = [(tag, i1 + start, i2 + start, j1 + start, j2 + start) for tag, i1, i2, j1, j2 in opcodes]
+	if start > 0:
+		opcodes.insert(0, ("equal", 0, start, 0, start))
+	if end > 0 and left_out == 0:
+		opcodes.append(("equal", len(a) - end, len(a), len(b) - end, len(b)))
+	return opcodes, left_out
+
+# Opcodes grouped into hunks with context lines around changes, as difflib does.
+def _hunks(opcodes: List[Opcode], context: int) -> Iterator[List[Opcode]]:
+	if len(opcodes) == 0:
+		return
+	if opcodes[0][0] == "equal":
+		tag, i1, i2, j1, j2 = opcodes[0]
+		opcodes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+	if opcodes[-1][0] == "equal":
+		tag, i1, i2, j1, j2 = opcodes[-1]
+		opcodes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+	hunk: List[Opcode] = []
+	for tag, i1, i2, j1, j2 in opcodes:
+		if tag == "equal" and i2 - i1 > 2 * context:
+			hunk.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+			yield hunk
+			hunk = []
+			i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+		hunk.append((tag, i1, i2, j1, j2))
+	if len(hunk) > 0 and not (len(hunk) == 1 and hunk[0][0] == "equal"):
+		yield hunk
+
+# Range of hunk lines the way unified diff prints it.
+def _range(start: int, stop: int) -> str:
+	if stop - start == 1:
+		return "%d" % (start + 1)
+	return "%d,%d" % (start + 1 if stop > start else start, stop - start)
+
+# Unified diff of expected and actual output in the format of difflib.unified_diff, but
+# bounded: lines are hashed once, outputs of more than max_lines lines show first
+# differing lines after common start only and at most max_hunks hunks are shown. What is left out is counted on the last line.
+def unified(expected: str, actual: str, fromfile: str = "expected_stdout", tofile: str = "actual_stdout", context: int = config.DIFF_CONTEXT, max_hunks: int = config.DIFF_MAX_HUNKS, max_lines: int = config.DIFF_MAX_LINES, first_lines: int = config.DIFF_FIRST_LINES) -> str:
+	lines_a = expected.splitlines()
+	lines_b = actual.splitlines()
+	table: Dict[str, int] = {}
+	a = _ids(lines_a, table)
+	b = _ids(lines_b, table)
+	opcodes, left_out = _opcodes(a, b, max_lines, first_lines)
+	diff: List[str] = []
+	shown = 0
+	hidden = 0
+	for hunk in _hunks(opcodes, context):
+		if max_hunks is not None and shown >= max_hunks:
+			hidden += 1
+			continue
+		if shown == 0:
+			diff += ["--- %s\n" % (fromfile), "+++ %s\n" % (tofile)]
+		shown += 1
+		diff.append("@@ -%s +%s @@\n" % (_range(hunk[0][1], hunk[-1][2]), _range(hunk[0][3], hunk[-1][4])))
+		for tag, i1, i2, j1, j2 in hunk:
+			if tag == "equal":
+				diff += [" " + line for line in lines_a[i1:i2]]
+				continue
+			diff += ["-" + line for line in lines_a[i1:i2]]
+			diff += ["+" + line for line in lines_b[j1:j2]]
+	if hidden > 0:
+		diff.append("... %d more hunks are not shown" % (hidden))
+	if left_out > 0:
+		diff.append("... %d more differing lines are not shown, outputs are too large for full diff" % (left_out))
+	return "\n".join(diff)
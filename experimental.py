@@ -1,13 +1,22 @@
+import array
+import asyncio
+import copy
+import itertools
+import math
 import os
 import sys
 import time
-import subprocess
 import re
 import pyperclip
+from concurrent.futures import Executor, Future
 from enum import Enum
-from typing import List, Union, Tuple, Set, Dict
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, List, Union, Tuple, Set, Dict
 
+from suite import batch
+from suite import bench
 from suite import config
+from suite import process
+from suite import store
 from suite import tools
 
 def convert_to_int(raw: str) -> int:
@@ -64,7 +73,95 @@ class Range:
 	def to_string(self) -> str:
 		return "<in range from %d to %d>" % (self.lo, self.hi)
 
-ExpectedT = Union[Strict, Range]
+# Any of expected values, for example outputs of several reference executables.
+class OneOf:
+	def __init__(self, options: List[Strict]):
+		self.options = options
+
+	def __eq__(self, other: str) -> bool:
+		return any(option == other for option in self.options)
+
+	def __ne__(self, other: str) -> bool:
+		return not (self == other)
+
+	def to_string(self) -> str:
+		return "<one of %s>" % (", ".join(option.to_string() for option in self.options))
+
+# Every number of output checked at once, for outputs of thousands of values: numbers are
+# parsed in one pass and compared with expected values, or with bounds [lo, hi) as in Range,
+# where actual value may differ from expected one by max(abs_eps, rel_eps * |expected|).
+# Bounds may be single values for all numbers, then count (if given) is expected count.
+class Numbers:
+	# Number should not stick to word or number before it, sign is kept even after word.
+	PATTERN = re.compile(r"[-+]?(?<![\w.])(?:(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|inf(?:inity)?|nan)(?!\w)", re.IGNORECASE)
+
+	def __init__(self, expected: List[Union[int, float]] = None, lo: Union[List[Union[int, float]], int, float] = None, hi: Union[List[Union[int, float]], int, float] = None, count: int = None, abs_eps: float = 0.0, rel_eps: float = 0.0):
+		if (expected is None) == (lo is None and hi is None):
+			raise ValueError("Expected either values or bounds of numbers.")
+		self.expected = None if expected is None else array.array("d", expected)
+		self.lo = Numbers.__bounds(lo, -float("inf"))
+		self.hi = Numbers.__bounds(hi, float("inf"))
+		self.count = len(self.expected) if self.expected is not None else count
+		for bounds in (self.lo, self.hi):
+			if isinstance(bounds, array.array):
+				if self.count is not None and self.count != len(bounds):
+					raise ValueError("Bounds should have one value for every number.")
+				self.count = len(bounds)
+		self.abs_eps = abs_eps
+		self.rel_eps = rel_eps
+
+	@staticmethod
+	def __bounds(bounds: Union[List[Union[int, float]], int, float], default: float) -> Union[array.array, float]:
+		if bounds is None:
+			return default
+		if isinstance(bounds, (int, float)):
+			return float(bounds)
+		return array.array("d", bounds)
+
+	def __tolerance(self, expected: float) -> float:
+		return max(self.abs_eps, self.rel_eps * abs(expected))
+
+	# NaN is never equal to anything, but expected NaN is matched by NaN.
+	def __differs(self, actual: float, expected: float) -> bool:
+		if math.isnan(expected):
+			return not math.isnan(actual)
+		return actual != expected and not abs(actual - expected) <= self.__tolerance(expected)
+
+	def __outside(self, actual: float, lo: float, hi: float) -> bool:
+		return not (lo - self.__tolerance(lo) <= actual < hi + self.__tolerance(hi))
+
+	# Position of first failed number (or of first missing or extra one) or None.
+	def mismatch(self, values: array.array) -> int:
+		if self.expected is not None:
+			if self.abs_eps == 0.0 and self.rel_eps == 0.0 and values == self.expected:
+				return None
+			flags = map(self.__differs, values, self.expected)
+		else:
+			lo = self.lo if isinstance(self.lo, array.array) else itertools.repeat(self.lo)
+			hi = self.hi if isinstance(self.hi, array.array) else itertools.repeat(self.hi)
+			flags = map(self.__outside, values, lo, hi)
+		position = next(itertools.compress(itertools.count(), flags), None)
+		if position is None and self.count is not None and len(values) != self.count:
+			position = min(len(values), self.count)
+		return position
+
+	# Numbers of output, parsed all at once.
+	@staticmethod
+	def parse(stdout: str) -> Tuple[List[str], array.array]:
+		raw = Numbers.PATTERN.findall(stdout)
+		return raw, array.array("d", map(float, raw))
+
+	def to_string(self, position: int) -> str:
+		if self.count is not None and position >= self.count:
+			return "<no more numbers>"
+		if self.expected is not None:
+			tolerance = self.__tolerance(self.expected[position])
+			return "%r" % (self.expected[position]) + (" +- %g" % (tolerance) if tolerance > 0 else "")
+		lo = self.lo[position] if isinstance(self.lo, array.array) else self.lo
+		hi = self.hi[position] if isinstance(self.hi, array.array) else self.hi
+		return "<in range from %g to %g>" % (lo, hi)
+
+ExpectedT = Union[Strict, Range, OneOf]
 ExpectedRawT = Union[List[int], List[float], str, int, float]
 
 def expected_from_array(arr: List[ExpectedRawT]) -> List[ExpectedT]:
@@ -82,19 +179,64 @@ class Errno(Enum):
 	ERROR_OUTPUT_FORMAT = 8
 	ERROR_TIMEOUT = 9
 	ERROR_UNKNOWN = 10
-
+	ERROR_OUTPUT_LIMIT = 11
+	ERROR_OUTPUT_MISMATCH = 12
+	ERROR_MEMORY_LIMIT = 13
+	ERROR_CPU_LIMIT = 14
+	ERROR_FILE_SIZE_LIMIT = 15
+	ERROR_BENCH_BUDGET = 16
+	ERROR_COMPLEXITY = 17
+
+# Slots and shared category sets keep results of large suites small. Numbers are kept in
+# columns (see tools.Columns): of its own until result is collected into category, then
+# of category (see attach).
 class TestResult:
-	def __init__(self, errno: Errno, categories: Set[str], timer: int, stderr: str = None, expected_exitcode: Set[int] = None, actual_exitcode: int = None, assert_pos: int = None, actual_assert: str = None, expected_assert: str = None):
-		self.is_pass = errno == Errno.ERROR_SUCCESS
-		self.errno = errno
-		self.categories = categories
-		self.timer = timer
-		self.stderr = stderr
+	__slots__ = ("columns", "row", "categories", "stderr", "expected_exitcode", "assert_pos", "actual_assert", "expected_assert", "output_limit", "usage", "limits", "budget_error", "bench")
+
+	FIELDS: Dict[str, str] = {"errno": "b", "timer": "q", "actual_exitcode": "q"}
+	# Verdicts which depend on machine and load rather than on program alone.
+	UNSETTLED = frozenset((Errno.ERROR_TIMEOUT, Errno.ERROR_UNKNOWN, Errno.ERROR_OUTPUT_LIMIT, Errno.ERROR_MEMORY_LIMIT, Errno.ERROR_CPU_LIMIT, Errno.ERROR_FILE_SIZE_LIMIT))
+
+	def __init__(self, errno: Errno, categories: Set[str], timer: int, stderr: str = None, expected_exitcode: Set[int] = None, actual_exitcode: int = None, assert_pos: int = None, actual_assert: str = None, expected_assert: str = None, output_limit: int = None, usage: process.Usage = None, limits: process.Limits = None, budget_error: str = None):
+		self.columns = tools.Columns(TestResult.FIELDS)
+		self.row = self.columns.append({"errno": errno.value, "timer": timer, "actual_exitcode": actual_exitcode})
+		self.categories = tools.intern(frozenset(categories))
+		# Error output is shown for failures only.
+		self.stderr = None if self.is_pass else tools.truncate(stderr, config.PREVIEW_LENGTH)
 		self.expected_exitcode = expected_exitcode
-		self.actual_exitcode = actual_exitcode
 		self.assert_pos = assert_pos
 		self.actual_assert = actual_assert
 		self.expected_assert = expected_assert
+		self.output_limit = output_limit
+		self.usage = usage
+		self.limits = limits
+		self.budget_error = budget_error
+		self.bench: bench.Benchmark = None
+
+	# Moves numbers of result to columns of its category.
+	def attach(self, columns: tools.Columns):
+		self.row = columns.append(self.columns.row(self.row))
+		self.columns = columns
+
+	@property
+	def errno(self) -> Errno:
+		return Errno(self.columns.get("errno", self.row))
+
+	@property
+	def is_pass(self) -> bool:
+		return self.columns.get("errno", self.row) == Errno.ERROR_SUCCESS.value
+
+	@property
+	def timer(self) -> int:
+		return self.columns.get("timer", self.row)
+
+	# Finished run which has been compared, the same on every later run.
+	def is_definitive(self) -> bool:
+		return self.errno not in TestResult.UNSETTLED
+
+	@property
+	def actual_exitcode(self) -> int:
+		return self.columns.get("actual_exitcode", self.row)
 
 	def str_error(self) -> str:
 		match self.errno:
@@ -109,21 +251,81 @@ class TestResult:
 			case Errno.ERROR_OUTPUT_FORMAT: return "output format is incorrect"
 			case Errno.ERROR_TIMEOUT: return "timeout"
 			case Errno.ERROR_UNKNOWN: return "unknown"
+			case Errno.ERROR_OUTPUT_LIMIT: return "output limit exceeded, program wrote more than %d bytes" % (self.output_limit)
+			case Errno.ERROR_OUTPUT_MISMATCH: return "output differs from golden file at byte %d" % (self.assert_pos)
+			case Errno.ERROR_MEMORY_LIMIT: return self.limits.str_breach(process.Status.MEMORY_LIMIT)
+			case Errno.ERROR_CPU_LIMIT: return self.limits.str_breach(process.Status.CPU_LIMIT)
+			case Errno.ERROR_FILE_SIZE_LIMIT: return self.limits.str_breach(process.Status.FILE_SIZE_LIMIT)
+			case Errno.ERROR_BENCH_BUDGET: return self.budget_error
+			case Errno.ERROR_COMPLEXITY: return "running time grows as %s, but should grow at most as O(%s)" % (self.actual_assert, self.expected_assert)
 			case _: raise ValueError("Type of errno is not supported.")
 
 	def empty_stderr(self) -> bool:
 		return self.stderr == "" or self.stderr is None
 
+# How pattern of tester is matched against output.
+class MatchMode(Enum):
+	# Pattern matches somewhere in output.
+	SEARCH = 0
+	# Pattern matches whole output (without its last line break).
+	FULL = 1
+	# As SEARCH, but ^ and $ match at start and end of every line.
+	MULTILINE = 2
+	# Pattern matches every line of output, values of all lines follow one another.
+	LINES = 3
+
+# Pattern compiled once and shared by all tests of tester, so it does not depend on
+# small cache of re module when many testers run in one process.
+class Regex:
+	def __init__(self, pattern: Union[str, re.Pattern], mode: MatchMode = MatchMode.SEARCH):
+		source, flags = (pattern.pattern, pattern.flags) if isinstance(pattern, re.Pattern) else (pattern, 0)
+		if mode == MatchMode.MULTILINE:
+			flags |= re.MULTILINE
+		self.pattern = pattern if isinstance(pattern, re.Pattern) and flags == pattern.flags else re.compile(source, flags)
+		self.mode = mode
+		# Lines are matched by one scan of finditer instead of splitting output into lines.
+		self.lines = re.compile("^(?:%s)$" % (source), flags | re.MULTILINE) if mode == MatchMode.LINES else None
+
+	# Values captured by groups in output, or None if output does not match.
+	def values(self, stdout: str) -> List[str]:
+		end = len(stdout) - 1 if stdout.endswith("\n") else len(stdout)
+		match self.mode:
+			case MatchMode.SEARCH | MatchMode.MULTILINE:
+				matches = self.pattern.search(stdout)
+			case MatchMode.FULL:
+				matches = self.pattern.fullmatch(stdout, 0, end)
+			case MatchMode.LINES:
+				return self.__lines(stdout, end)
+		return None if matches is None else list(matches.groups())
+
+	# Every match should start right at the next line, otherwise some line does not match.
+	def __lines(self, stdout: str, end: int) -> List[str]:
+		if stdout == "":
+			return []
+		values = []
+		position = 0
+		for matches in self.lines.finditer(stdout, 0, end):
+			if matches.start() != position:
+				return None
+			values.extend(matches.groups())
+			position = matches.end() + 1
+		return values if position > end else None
+
+	def __str__(self) -> str:
+		return self.pattern.pattern
+
 class Actual:
-	def __init__(self, stdout: str, stderr: str, exitcode: int):
+	def __init__(self, stdout: str, stderr: str, exitcode: int, divergence: int = None, stopped: bool = False):
 		self.stdout = stdout
 		self.stderr = stderr
 		self.exitcode = exitcode
 		self.error = exitcode != 0
+		self.divergence = divergence
+		self.stopped = stopped
 
 class Expected:
-	def __init__(self, regex_pattern: str, expected: List[ExpectedT], fails: bool, exitcode: Union[int, List[int]], categories: Set[str]):
-		self.regex_pattern = regex_pattern
+	def __init__(self, regex_pattern: Union[str, Regex], expected: Union[List[ExpectedT], Numbers], fails: bool, exitcode: Union[int, List[int]], categories: Set[str], golden: str = None):
+		self.regex = regex_pattern if isinstance(regex_pattern, Regex) else Regex(regex_pattern)
 		self.expected = expected
 		self.fails = fails
 		self.exitcode: Set[int] = None
@@ -134,6 +336,12 @@ class Expected:
 		else:
 			raise ValueError("Expected as int, or List[int] as exitcode.")
 		self.categories = categories
+		self.golden = golden
+
+	def make_sink(self):
+		if self.golden is not None:
+			return process.GoldenSink(self.golden)
+		return None
 
 	def __compare_failed(self, actual: Actual, timer_test: int) -> TestResult:
 		empty_stderr = actual.stderr == "" or actual.stderr is None
@@ -156,20 +364,39 @@ class Expected:
 
 	def __compare_passes(self, actual: Actual, timer_test: int) -> TestResult:
 		empty_stderr = actual.stderr == "" or actual.stderr is None
-		matches = re.search(self.regex_pattern, actual.stdout)
 
 		# CASE: If should pass, then error output should be empty.
 		if not empty_stderr:
 			return TestResult(errno = Errno.ERROR_STDERR_NOT_EMPTY, categories = self.categories, timer = timer_test, stderr = actual.stderr)
 
+		# CASE: If golden file is given, then output should be equal to it.
+		if self.golden is not None:
+			if actual.divergence is not None:
+				return TestResult(errno = Errno.ERROR_OUTPUT_MISMATCH, categories = self.categories, timer = timer_test, assert_pos = actual.divergence)
+			return TestResult(errno = Errno.ERROR_SUCCESS, categories = self.categories, timer = timer_test)
+
+		values = self.regex.values(actual.stdout)
+
 		# CASE: If should pass, then regular expression should matching.
-		if matches is None:
+		if values is None:
 			return TestResult(errno = Errno.ERROR_OUTPUT_FORMAT, categories = self.categories, timer = timer_test)
 
+		# CASE: If numbers are expected, then every number of output should be within tolerance.
+		if isinstance(self.expected, Numbers):
+			raw, values = Numbers.parse(actual.stdout)
+			position = self.expected.mismatch(values)
+			if position is not None:
+				raw_value = raw[position] if position < len(raw) else "<no more numbers>"
+				return TestResult(errno = Errno.ERROR_ASSERTION, categories = self.categories, timer = timer_test, assert_pos = position, actual_assert = raw_value, expected_assert = self.expected.to_string(position))
+			return TestResult(errno = Errno.ERROR_SUCCESS, categories = self.categories, timer = timer_test)
+
 		# CASE: If should pass, then values should be in Strict or Range assert.
 		for i in range(len(self.expected)):
-			raw_value = matches.group(i + 1)
 			expected_value = self.expected[i]
+			# Output of LINES pattern may have fewer lines than expected.
+			if i >= len(values):
+				return TestResult(errno = Errno.ERROR_ASSERTION, categories = self.categories, timer = timer_test, assert_pos = i, actual_assert = "<no more values>", expected_assert = expected_value.to_string())
+			raw_value = values[i]
 			if expected_value != raw_value:
 				return TestResult(errno = Errno.ERROR_ASSERTION, categories = self.categories, timer = timer_test, assert_pos = i, actual_assert = raw_value, expected_assert = expected_value.to_string())
 
@@ -177,6 +404,10 @@ class Expected:
 		return TestResult(errno = Errno.ERROR_SUCCESS, categories = self.categories, timer = timer_test)
 
 	def compare(self, actual: Actual, timer_test: int) -> TestResult:
+		# CASE: Program was stopped as soon as output differs from expected.
+		if actual.stopped:
+			return TestResult(errno = Errno.ERROR_OUTPUT_MISMATCH, categories = self.categories, timer = timer_test, stderr = actual.stderr, assert_pos = actual.divergence)
+
 		# CASE: Should fail, but program returns 0.
 		if self.fails and not actual.error:
 			return TestResult(errno = Errno.ERROR_SHOULD_FAIL, categories = self.categories, timer = timer_test)
@@ -192,109 +423,442 @@ class Expected:
 
 		return self.__compare_passes(actual, timer_test)
 
+LIMIT_ERRNOS: Dict[process.Status, Errno] = {
+	process.Status.MEMORY_LIMIT: Errno.ERROR_MEMORY_LIMIT,
+	process.Status.CPU_LIMIT: Errno.ERROR_CPU_LIMIT,
+	process.Status.FILE_SIZE_LIMIT: Errno.ERROR_FILE_SIZE_LIMIT,
+}
+
 def get_time() -> int:
 	return time.time_ns() // 1000000
 
 class CmdTest:
-	def __init__(self, input: List[str], expected: Expected, timeout: int = config.DEFAULT_TIMEOUT, name: str = None):
+	def __init__(self, input: List[str], expected: Expected, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, max_output_bytes: int = None, input_file: str = None, limits: process.Limits = None):
 		self.input = input
 		self.expected = expected
 		self.timeout = timeout
 		self.name = name
-
-	def run(self, filename: str) -> TestResult:
-		executable = os.path.abspath(filename)
+		self.max_output_bytes = max_output_bytes
+		self.input_file = input_file
+		self.limits = limits
+		self.plan: bench.Plan = None
+
+	# Files the test depends on besides executable.
+	def files(self) -> List[str]:
+		return [path for path in [self.input_file, self.expected.golden] if path is not None]
+
+	def __argv(self, filename: str) -> List[str]:
+		return [tools.resolve(filename)] + self.input
+
+	def __output_limit(self) -> int:
+		return self.max_output_bytes or config.DEFAULT_MAX_OUTPUT_BYTES
+
+	def __result(self, execution: process.Execution, sink) -> TestResult:
+		if execution.timeout:
+			test_result = TestResult(errno = Errno.ERROR_TIMEOUT, categories = self.expected.categories, timer = execution.timer)
+		elif execution.output_limit:
+			test_result = TestResult(errno = Errno.ERROR_OUTPUT_LIMIT, categories = self.expected.categories, timer = execution.timer, stderr = execution.stderr, output_limit = self.__output_limit())
+		# Failure the test expects is never reported as limit breach.
+		elif execution.limit_exceeded and not (self.expected.fails and execution.exitcode in self.expected.exitcode):
+			test_result = TestResult(errno = LIMIT_ERRNOS[execution.status], categories = self.expected.categories, timer = execution.timer, stderr = execution.stderr, actual_exitcode = execution.exitcode, limits = self.limits)
+		else:
+			actual = Actual(execution.stdout, execution.stderr, execution.exitcode, getattr(sink, "divergence", None), execution.aborted)
+			start = time.perf_counter_ns()
+			test_result = self.expected.compare(actual, execution.timer)
+			execution.usage.compare_us = (time.perf_counter_ns() - start) // 1000
+		test_result.usage = execution.usage
+		return test_result
+
+	def __run(self, filename: str) -> TestResult:
 		start = get_time()
-		program = subprocess.Popen([executable] + self.input, stdout = subprocess.PIPE, stdin = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
 		try:
-			output, error = program.communicate(timeout = self.timeout)
-			end = get_time()
-			timer = end - start
-			actual = Actual(output, error, program.returncode)
-			return self.expected.compare(actual, timer)
-		except subprocess.TimeoutExpired:
-			program.kill()
+			sink = self.expected.make_sink()
+			return self.__result(process.execute(self.__argv(filename), self.input_file, self.timeout, sink, self.__output_limit(), self.limits), sink)
+		except Exception as err:
 			end = get_time()
-			return TestResult(errno = Errno.ERROR_TIMEOUT, categories = self.expected.categories, timer = end - start)
+			return TestResult(errno = Errno.ERROR_UNKNOWN, categories = self.expected.categories, timer = end - start, stderr = str(err))
+
+	async def __run_async(self, filename: str) -> TestResult:
+		start = get_time()
+		try:
+			sink = self.expected.make_sink()
+			return self.__result(await process.execute_async(self.__argv(filename), self.input_file, self.timeout, sink, self.__output_limit(), self.limits), sink)
 		except Exception as err:
-			program.kill()
 			end = get_time()
 			return TestResult(errno = Errno.ERROR_UNKNOWN, categories = self.expected.categories, timer = end - start, stderr = str(err))
 
+	def __bench(self, test_result: TestResult, benchmark: bench.Benchmark) -> TestResult:
+		test_result.bench = benchmark
+		if test_result.is_pass and self.plan is not None and self.plan.budget is not None and benchmark is not None:
+			error = self.plan.budget.check(benchmark)
+			if error is not None:
+				budget_result = TestResult(errno = Errno.ERROR_BENCH_BUDGET, categories = self.expected.categories, timer = test_result.timer, usage = test_result.usage, budget_error = error)
+				budget_result.bench = benchmark
+				return budget_result
+		return test_result
+
+	# Plan of test itself wins over plan of benchmark mode, benchmark stops at first failed run.
+	def run(self, filename: str, plan: bench.Plan = None) -> TestResult:
+		plan = self.plan or plan
+		if plan is None:
+			return self.__run(filename)
+		return self.__bench(*plan.run(lambda: self.__run(filename), lambda test_result: test_result.usage, lambda test_result: not test_result.is_pass))
+
+	async def run_async(self, filename: str, plan: bench.Plan = None) -> TestResult:
+		plan = self.plan or plan
+		if plan is None:
+			return await self.__run_async(filename)
+		return self.__bench(*await plan.run_async(lambda: self.__run_async(filename), lambda test_result: test_result.usage, lambda test_result: not test_result.is_pass))
+
+# Runs program at every size and fits measured times against complexity curves of
+# bench.COMPLEXITIES. Output is not checked, program should only succeed at every size.
+class ScalingTest:
+	def __init__(self, inputs: List[List[str]], sizes: List[int], expected_complexity: str, expected: Expected, plan: bench.Plan, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, max_output_bytes: int = None, limits: process.Limits = None):
+		if expected_complexity not in bench.COMPLEXITIES:
+			raise ValueError("Complexity should be one of %s." % (", ".join(bench.COMPLEXITIES)))
+		bench.check_sizes(sizes)
+		self.inputs = inputs
+		self.sizes = sizes
+		self.expected_complexity = expected_complexity
+		self.expected = expected
+		self.plan = plan
+		self.timeout = timeout
+		self.name = name
+		self.max_output_bytes = max_output_bytes
+		self.limits = limits
+
+	def files(self) -> List[str]:
+		return []
+
+	@staticmethod
+	def __failed(execution: process.Execution) -> bool:
+		return execution.status != process.Status.FINISHED or execution.exitcode != config.EXIT_SUCCESS
+
+	def __failure(self, execution: process.Execution, usage: process.Usage) -> TestResult:
+		timer = usage.wall_us // 1000
+		if execution.timeout:
+			return TestResult(errno = Errno.ERROR_TIMEOUT, categories = self.expected.categories, timer = timer, usage = usage)
+		if execution.output_limit:
+			return TestResult(errno = Errno.ERROR_OUTPUT_LIMIT, categories = self.expected.categories, timer = timer, stderr = execution.stderr, output_limit = self.max_output_bytes or config.DEFAULT_MAX_OUTPUT_BYTES, usage = usage)
+		if execution.limit_exceeded:
+			return TestResult(errno = LIMIT_ERRNOS[execution.status], categories = self.expected.categories, timer = timer, stderr = execution.stderr, actual_exitcode = execution.exitcode, usage = usage, limits = self.limits)
+		return TestResult(errno = Errno.ERROR_SHOULD_PASS, categories = self.expected.categories, timer = timer, stderr = execution.stderr, actual_exitcode = execution.exitcode, usage = usage)
+
+	def __result(self, fit: bench.Fit, usage: process.Usage) -> TestResult:
+		if not fit.fits(self.expected_complexity):
+			return TestResult(errno = Errno.ERROR_COMPLEXITY, categories = self.expected.categories, timer = usage.wall_us // 1000, actual_assert = str(fit), expected_assert = self.expected_complexity, usage = usage)
+		return TestResult(errno = Errno.ERROR_SUCCESS, categories = self.expected.categories, timer = usage.wall_us // 1000, usage = usage)
+
+	def run(self, filename: str, plan: bench.Plan = None) -> TestResult:
+		usages = []
+		times = []
+		for input in self.inputs:
+			once = lambda: process.execute([tools.resolve(filename)] + input, None, self.timeout, process.NullSink(), self.max_output_bytes, self.limits)
+			execution, benchmark = self.plan.run(once, lambda execution: execution.usage, ScalingTest.__failed)
+			usages.append(execution.usage)
+			if ScalingTest.__failed(execution):
+				return self.__failure(execution, process.Usage.summary(usages))
+			times.append(benchmark.typical())
+		return self.__result(bench.fit(self.sizes, times), process.Usage.summary(usages))
+
+	async def run_async(self, filename: str, plan: bench.Plan = None) -> TestResult:
+		usages = []
+		times = []
+		for input in self.inputs:
+			once = lambda: process.execute_async([tools.resolve(filename)] + input, None, self.timeout, process.NullSink(), self.max_output_bytes, self.limits)
+			execution, benchmark = await self.plan.run_async(once, lambda execution: execution.usage, ScalingTest.__failed)
+			usages.append(execution.usage)
+			if ScalingTest.__failed(execution):
+				return self.__failure(execution, process.Usage.summary(usages))
+			times.append(benchmark.typical())
+		return self.__result(bench.fit(self.sizes, times), process.Usage.summary(usages))
+
+# Expected values are extracted with regular expression from outputs of reference executables
+# run on the same input, or exitcode of reference is expected if it fails.
+class DiffTest:
+	def __init__(self, test: CmdTest, reference: store.Reference):
+		self.test = test
+		self.reference = reference
+		self.expected = test.expected
+		self.name = test.name
+		self.plan = test.plan
+
+	def files(self) -> List[str]:
+		return self.test.files() + self.reference.filenames
+
+	def __expected(self) -> Expected:
+		outputs = self.reference.outputs(self.test.input, self.test.input_file)
+		if outputs[0].exitcode != config.EXIT_SUCCESS:
+			return Expected(self.expected.regex, None, True, outputs[0].exitcode, self.expected.categories)
+		values = []
+		for output in outputs:
+			if output.exitcode != config.EXIT_SUCCESS:
+				continue
+			matched = self.expected.regex.values(output.stdout)
+			if matched is None:
+				raise RuntimeError("Output of reference does not match %s." % (self.expected.regex))
+			values.append(matched)
+		expected = [Strict(options[0]) if len(set(options)) == 1 else OneOf([Strict(option) for option in dict.fromkeys(options)]) for options in zip(*values)]
+		return Expected(self.expected.regex, expected, False, config.ERROR_SUCCESS, self.expected.categories)
+
+	def run(self, filename: str, plan: bench.Plan = None) -> TestResult:
+		test = copy.copy(self.test)
+		try:
+			test.expected = self.__expected()
+		except Exception as err:
+			return TestResult(errno = Errno.ERROR_UNKNOWN, categories = self.expected.categories, timer = 0, stderr = str(err))
+		return test.run(filename, plan)
+
+	async def run_async(self, filename: str, plan: bench.Plan = None) -> TestResult:
+		test = copy.copy(self.test)
+		try:
+			# Reference may be run here, so it is moved off event loop.
+			test.expected = await asyncio.to_thread(self.__expected)
+		except Exception as err:
+			return TestResult(errno = Errno.ERROR_UNKNOWN, categories = self.expected.categories, timer = 0, stderr = str(err))
+		return await test.run_async(filename, plan)
+
 class CategoryResult:
 	def __init__(self, category: str, tests: List[TestResult], timer: int):
 		self.category = category
 		self.tests = tests
 		self.timer = timer
+		self.usage = process.Usage.summary([test.usage for test in self.tests])
+		# Numbers of every test are kept here, counts are taken from them.
+		self.columns = tools.Columns(TestResult.FIELDS)
+		for test in self.tests:
+			test.attach(self.columns)
 
 	def __str__(self) -> str:
-		return "Suite \"%s\": %d/%d tests passed in %d ms" % (self.category, self.passed(), self.total(), self.timer)
+		return "Suite \"%s\": %d/%d tests passed in %d ms (CPU %s ms, peak RSS %s KB%s%s)" % (self.category, self.passed(), self.total(), self.timer, self.usage.str_cpu(), self.usage.str_max_rss(), self.usage.str_harness(), self.usage.str_strays())
 
 	def passed(self) -> int:
-		return sum(1 for test in self.tests if test.is_pass)
+		return self.count(Errno.ERROR_SUCCESS)
+
+	# Number of tests failed with given error.
+	def count(self, errno: Errno) -> int:
+		return self.columns.column("errno").count(errno.value)
+
+	# Pass flags of all tests.
+	def passed_column(self) -> array.array:
+		return array.array("b", (errno == Errno.ERROR_SUCCESS.value for errno in self.columns.column("errno")))
+
+	def to_dict(self) -> Dict[str, Any]:
+		return {"category": self.category, "passed": self.passed(), "total": self.total(), "timer": self.timer}
 
 	def total(self) -> int:
 		return len(self.tests)
 
-class RegexTester:
-	def __init__(self, category: str, filename: str, regex_pattern: str):
+class RegexTester(batch.Runs):
+	def __init__(self, category: str, filename: str, regex_pattern: Union[str, re.Pattern], limits: process.Limits = None, reference: store.Reference = None, mode: MatchMode = MatchMode.SEARCH):
 		self.category = category
 		self.filename = filename
+		# Path tests run, resolved once instead of on every run.
+		self.executable = os.path.abspath(filename)
 		self.regex_pattern = regex_pattern
+		self.mode = mode
+		self.regex = Regex(regex_pattern, mode)
+		self.limits = limits
+		self.reference = reference
 		self.tests: List[CmdTest] = []
-
-	def is_empty(self) -> bool:
-		return len(self.tests) == 0
+		# Generated tests (see add_generator) are made only when they are run, and only
+		# those for which select(position, test) holds.
+		self.sources: List[batch.TestSource] = []
+		self.select: Callable = None
 
 	def extract_only(self, categories: Set[str]) -> 'RegexTester':
-		new_tester = RegexTester(self.category, self.filename, self.regex_pattern)
+		new_tester = RegexTester(self.category, self.filename, self.regex_pattern, self.limits, self.reference, self.mode)
+		new_tester.regex = self.regex
 		for test in self.tests:
 			if test.expected.categories.issubset(categories):
 				new_tester.tests.append(test)
+		new_tester.sources = [source for source in self.sources if set(source.categories).issubset(categories)]
 		return new_tester
 
-	def run(self) -> CategoryResult:
-		result = []
-		start = get_time()
-		print("=> Test suite: \"%s\" tests." % (self.category))
-		for i, test in enumerate(self.tests):
-			n_test: Union[str, int] = test.name
-			if n_test is None:
-				n_test = i + 1
-			print("==> Running test %s" % (str(n_test)))
-			test_result = test.run(self.filename)
-			if test_result.is_pass:
-				print("===> SUCCESS in %d ms" % (test_result.timer))
+	# Timings depend on machine and load, so benchmarked tests are never cached, nor are
+	# results which are not definitive (see TestResult.is_definitive).
+	def __lookup(self, cache: store.ResultCache, test: CmdTest) -> TestResult:
+		if cache is None or test.plan is not None:
+			return None
+		return cache.get(cache.key(self.filename, test))
+
+	def __store(self, cache: store.ResultCache, test: CmdTest, test_result: TestResult) -> TestResult:
+		if cache is not None and test.plan is None and test_result.bench is None and test_result.is_definitive():
+			cache.put(cache.key(self.filename, test), test_result)
+		return test_result
+
+	def __run(self, test: CmdTest, context: batch.RunContext) -> TestResult:
+		return self.__store(context.cache, test, context.span.run(test.run, self.executable, context.plan))
+
+	async def __run_async(self, test: CmdTest, context: batch.RunContext) -> TestResult:
+		return self.__store(context.cache, test, await context.span.run_async(test.run_async(self.executable, context.plan)))
+
+	# Tests run are timed by span of context. With history, executor should be
+	# batch.LongestFirst flushed by caller.
+	def submit(self, executor: Executor, context: batch.RunContext) -> List[Future]:
+		futures = []
+		for test in self.tests:
+			cached = self.__lookup(context.cache, test)
+			if cached is not None:
+				futures.append(Future())
+				futures[-1].set_result(cached)
+			elif context.history is not None:
+				futures.append(executor.submit_estimated(context.history.estimate(self.category, test), self.__run, test, context))
+			else:
+				futures.append(executor.submit(self.__run, test, context))
+		return futures
+
+	# Generated tests run in executor as they are pulled, jobs of them in flight per worker.
+	def stream(self, executor: Executor, jobs: int, context: batch.RunContext) -> Iterator[Tuple[int, CmdTest, Future]]:
+		return batch.stream(executor, lambda test: self.__lookup(context.cache, test) or self.__run(test, context), batch.generate(self.sources, self.select), jobs * config.STREAM_WINDOW_PER_JOB)
+
+	def stream_async(self, semaphore: asyncio.Semaphore, jobs: int, context: batch.RunContext) -> AsyncIterator[Tuple[int, CmdTest, asyncio.Future]]:
+		return batch.stream_async(lambda test: tools.run_bounded(semaphore, self.__outcome_async(test, context)), batch.generate(self.sources, self.select), jobs * config.STREAM_WINDOW_PER_JOB)
+
+	async def __outcome_async(self, test: CmdTest, context: batch.RunContext) -> TestResult:
+		return self.__lookup(context.cache, test) or await self.__run_async(test, context)
+
+	# Semaphore is taken in order of task creation, so with history slow tests are created first.
+	def schedule(self, semaphore: asyncio.Semaphore, context: batch.RunContext) -> List[asyncio.Future]:
+		tasks: List[asyncio.Future] = [None] * len(self.tests)
+		for i in tools.longest_first(self.tests, None if context.history is None else lambda test: context.history.estimate(self.category, test)):
+			test = self.tests[i]
+			cached = self.__lookup(context.cache, test)
+			if cached is None:
+				tasks[i] = asyncio.create_task(tools.run_bounded(semaphore, self.__run_async(test, context)))
 			else:
-				print("===> FAILED")
-				print("====> ERROR: %s." % (test_result.str_error()))
-				if not test_result.empty_stderr():
-					print("[stderr %s]: %s" % (str(n_test), test_result.stderr), file = sys.stderr)
-			result.append(test_result)
-		end = get_time()
-		return CategoryResult(self.category, result, end - start)
-
-	def __add_test(self, input: List[str], expected: Union[List[ExpectedT], List[ExpectedRawT]], fails: bool, timeout: int, exitcode: Union[int, List[int]], categories: List[str], name: str) -> 'RegexTester':
+				tasks[i] = asyncio.get_running_loop().create_future()
+				tasks[i].set_result(cached)
+		return tasks
+
+	# Generated tests given by stream are reported after declared ones. Time of category is
+	# span of its tests (see batch.Span).
+	def collect(self, futures: List[Future], context: batch.RunContext, generated: Iterator[Tuple[int, CmdTest, Future]] = None) -> CategoryResult:
+		print("=> Test suite: \"%s\" tests." % (self.category))
+		result = [self.__report(i, test, future.result(), context) for i, (test, future) in enumerate(zip(self.tests, futures))]
+		if generated is not None:
+			result += [self.__report(len(self.tests) + position, test, future.result(), context) for position, test, future in generated]
+		return CategoryResult(self.category, result, context.span.timer())
+
+	async def collect_async(self, tasks: List[asyncio.Future], context: batch.RunContext, generated: AsyncIterator[Tuple[int, CmdTest, asyncio.Future]] = None) -> CategoryResult:
+		print("=> Test suite: \"%s\" tests." % (self.category))
+		result = [self.__report(i, test, await task, context) for i, (test, task) in enumerate(zip(self.tests, tasks))]
+		if generated is not None:
+			result += [self.__report(len(self.tests) + position, test, await task, context) async for position, test, task in generated]
+		return CategoryResult(self.category, result, context.span.timer())
+
+	def __report(self, i: int, test: CmdTest, test_result: TestResult, context: batch.RunContext) -> TestResult:
+		n_test: Union[str, int] = test.name
+		if n_test is None:
+			n_test = i + 1
+		print("==> Running test %s" % (str(n_test)))
+		if test_result.is_pass:
+			print("===> SUCCESS in %d ms" % (test_result.timer))
+		else:
+			print("===> FAILED")
+			print("====> ERROR: %s." % (test_result.str_error()))
+			if not test_result.empty_stderr():
+				print("[stderr %s]: %s" % (str(n_test), test_result.stderr), file = sys.stderr)
+		if test_result.bench is not None:
+			print("====> BENCHMARK: %s." % (test_result.bench))
+		if context.history is not None and test_result.usage is not None:
+			context.history.record(self.category, test, test_result.usage.wall_us)
+		if context.runs is not None:
+			context.runs.record(self.filename, self.category, test, test_result.is_pass, test_result.errno.name, test_result.errno.value, test_result.usage)
+		return test_result
+
+	# Limits of test win over limits of tester.
+	def __limits(self, limits: process.Limits) -> process.Limits:
+		if limits is None:
+			return self.limits
+		return limits.merge(self.limits)
+
+	def __make_test(self, input: List[str], expected: Union[List[ExpectedT], List[ExpectedRawT], Numbers], fails: bool, timeout: int, exitcode: Union[int, List[int]], categories: List[str], name: str, max_output_bytes: int, limits: process.Limits) -> CmdTest:
 		expected_list = None
-		if expected is not None:
+		if isinstance(expected, Numbers):
+			expected_list = expected
+		elif expected is not None:
 			if all(isinstance(item, ExpectedT) for item in expected):
 				expected_list = expected
 			else:
 				expected_list = expected_from_array(expected)
-		expected_object = Expected(self.regex_pattern, expected_list, fails, exitcode, set(categories))
-		self.tests.append(CmdTest(input, expected_object, timeout, name))
+		expected_object = Expected(self.regex, expected_list, fails, exitcode, set(categories))
+		return CmdTest(input, expected_object, timeout, name, max_output_bytes, limits = self.__limits(limits))
+
+	def __add_test(self, input: List[str], expected: Union[List[ExpectedT], List[ExpectedRawT], Numbers], fails: bool, timeout: int, exitcode: Union[int, List[int]], categories: List[str], name: str, max_output_bytes: int, limits: process.Limits) -> 'RegexTester':
+		self.tests.append(self.__make_test(input, expected, fails, timeout, exitcode, categories, name, max_output_bytes, limits))
+		return self
+
+	# Tests are made from (input, expected values) pairs of iterable returned by generator
+	# only when they are run, so memory is bounded by number of tests in flight instead of
+	# size of suite. Generator is called on every run.
+	def add_generator(self, generator: Callable[[], Iterable[Tuple[List[str], Union[List[ExpectedT], List[ExpectedRawT], Numbers]]]], categories: List[str] = [], timeout: int = config.DEFAULT_TIMEOUT, max_output_bytes: int = None, limits: process.Limits = None) -> 'RegexTester':
+		make = lambda input, expected: self.__make_test(input, expected, False, timeout, config.ERROR_SUCCESS, categories, None, max_output_bytes, limits)
+		self.sources.append(batch.TestSource(generator, make, categories))
+		return self
+
+	# Same as add_generator, but iterator is used up by first run, so tests can be run only once.
+	def add_from_iterable(self, pairs: Iterable[Tuple[List[str], Union[List[ExpectedT], List[ExpectedRawT], Numbers]]], categories: List[str] = [], timeout: int = config.DEFAULT_TIMEOUT, max_output_bytes: int = None, limits: process.Limits = None) -> 'RegexTester':
+		self.add_generator(lambda: pairs, categories, timeout, max_output_bytes, limits)
+		self.sources[-1].once = True
+		return self
+
+	def add_pass(self, input: List[str], expected: Union[List[ExpectedT], List[ExpectedRawT], Numbers], name: str = None, categories: List[str] = [], timeout: int = config.DEFAULT_TIMEOUT, max_output_bytes: int = None, limits: process.Limits = None) -> 'RegexTester':
+		return self.__add_test(input, expected, False, timeout, config.ERROR_SUCCESS, categories, name, max_output_bytes, limits)
+
+	def add_fail(self, input: List[str], exitcode: Union[int, List[int]], name: str = None, categories: List[str] = [], timeout: int = config.DEFAULT_TIMEOUT, max_output_bytes: int = None, limits: process.Limits = None) -> 'RegexTester':
+		return self.__add_test(input, None, True, timeout, exitcode, categories, name, max_output_bytes, limits)
+
+	# Test is run warmup + repeat times one after another and passes if its output is
+	# correct and timing statistics fit into budget.
+	def add_bench(self, input: List[str], expected: Union[List[ExpectedT], List[ExpectedRawT], Numbers], budget: bench.Budget, warmup: int = config.DEFAULT_WARMUP, repeat: int = config.DEFAULT_REPEAT, name: str = None, categories: List[str] = [], timeout: int = config.DEFAULT_TIMEOUT, max_output_bytes: int = None, limits: process.Limits = None) -> 'RegexTester':
+		self.__add_test(input, expected, False, timeout, config.ERROR_SUCCESS, categories, name, max_output_bytes, limits)
+		self.tests[-1].plan = bench.Plan(warmup, repeat, budget)
+		return self
+
+	# Program is run with arguments made by generator at every size, test passes if its running
+	# time grows no faster than expected complexity (one of bench.COMPLEXITIES).
+	def add_scaling(self, generator: Callable[[int], List[str]], sizes: List[int], expected: str, warmup: int = config.DEFAULT_WARMUP, repeat: int = config.DEFAULT_REPEAT, name: str = None, categories: List[str] = [], timeout: int = config.DEFAULT_TIMEOUT, max_output_bytes: int = None, limits: process.Limits = None) -> 'RegexTester':
+		# Sizes are checked before generator is called with them.
+		bench.check_sizes(sizes)
+		expected_object = Expected(self.regex, None, False, config.ERROR_SUCCESS, set(categories))
+		self.tests.append(ScalingTest([generator(size) for size in sizes], sizes, expected, expected_object, bench.Plan(warmup, repeat), timeout, name, max_output_bytes, self.__limits(limits)))
 		return self
 
-	def add_pass(self, input: List[str], expected: Union[List[ExpectedT], List[ExpectedRawT]], name: str = None, categories: List[str] = [], timeout: int = config.DEFAULT_TIMEOUT) -> 'RegexTester':
-		return self.__add_test(input, expected, False, timeout, config.ERROR_SUCCESS, categories, name)
+	# Expected values are given by reference executable of tester run on the same input.
+	def add_diff(self, input: List[str], name: str = None, categories: List[str] = [], timeout: int = config.DEFAULT_TIMEOUT, max_output_bytes: int = None, limits: process.Limits = None) -> 'RegexTester':
+		if self.reference is None:
+			raise ValueError("Differential test needs tester with reference executable.")
+		expected_object = Expected(self.regex, None, False, config.ERROR_SUCCESS, set(categories))
+		self.tests.append(DiffTest(CmdTest(input, expected_object, timeout, name, max_output_bytes, limits = self.__limits(limits)), self.reference))
+		return self
 
-	def add_fail(self, input: List[str], exitcode: Union[int, List[int]], name: str = None, categories: List[str] = [], timeout: int = config.DEFAULT_TIMEOUT) -> 'RegexTester':
-		return self.__add_test(input, None, True, timeout, exitcode, categories, name)
+	# Output is compared with golden file instead of regular expression, input_file (if any) is attached to stdin.
+	def add_golden(self, input: List[str], expected_file: str, input_file: str = None, name: str = None, categories: List[str] = [], timeout: int = config.DEFAULT_TIMEOUT, max_output_bytes: int = None, limits: process.Limits = None) -> 'RegexTester':
+		expected_object = Expected(self.regex, None, False, config.ERROR_SUCCESS, set(categories), golden = expected_file)
+		self.tests.append(CmdTest(input, expected_object, timeout, name, max_output_bytes, input_file, self.__limits(limits)))
+		return self
 
 class AllResult:
 	def __init__(self, results: List[CategoryResult], timer: int):
 		self.results = results
 		self.timer = timer
+		self.flat: List[TestResult] = None
+		self.index: tools.CategoryIndex = None
+
+	# Results of all categories in one list with index of their categories, built once.
+	def __indexed(self) -> Tuple[List[TestResult], tools.CategoryIndex]:
+		if self.index is None:
+			self.flat = [result for category in self.results for result in category.tests]
+			self.index = tools.CategoryIndex([result.categories for result in self.flat])
+		return self.flat, self.index
+
+	# Pass flags of all results in order of __indexed.
+	def __passed_column(self) -> array.array:
+		column = array.array("b")
+		for category in self.results:
+			column.extend(category.passed_column())
+		return column
 
 	def __get_total(self) -> int:
 		return sum(result.total() for result in self.results)
@@ -302,22 +866,40 @@ class AllResult:
 	def __get_passed(self) -> int:
 		return sum(result.passed() for result in self.results)
 
+	def to_dict(self) -> Dict[str, Any]:
+		return {
+			"passed": self.__get_passed(),
+			"total": self.__get_total(),
+			"timer": self.timer,
+			"categories": [result.to_dict() for result in self.results],
+		}
+
+	# Result of whole suite from result files of all its shards (see AllTester.run_shard).
+	# Shards run in parallel, so timers are those of the slowest shard.
+	@staticmethod
+	def merge(filenames: List[str]) -> 'AllResult':
+		shards = [store.ShardResult.load(filename) for filename in filenames]
+		results = [CategoryResult(name, tests, max(timers)) for name, tests, timers in batch.merge(shards)]
+		return AllResult(results, max(shard.timer for shard in shards))
+
 	def make_bash_envs(self, countable_categories: Dict[str, str], filename: str):
 		if countable_categories is None or len(countable_categories) == 0 or len(self.results) == 0:
 			return
 
+		flat, index = self.__indexed()
+		ratios = index.ratios(self.__passed_column(), countable_categories)
 		with open(filename, "w") as file_vars:
 			for count, varname in countable_categories.items():
-				total = 0
-				passed = 0
-				for category in self.results:
-					for result in category.tests:
-						if count in result.categories:
-							total += 1
-							if result.is_pass:
-								passed += 1
-				final_result = passed / total
-				file_vars.write("%s=%f\n" % (varname.upper(), final_result))
+				file_vars.write("%s=%f\n" % (varname.upper(), ratios[count]))
+				file_vars.write(process.Usage.summary([flat[i].usage for i in index.of(count)]).envs(varname.upper()))
+
+	# Statistics of benchmarked tests as BENCH_<CATEGORY>_<TEST NUMBER>_* variables.
+	def make_bench_envs(self, filename: str):
+		with open(filename, "w") as file_vars:
+			for category in self.results:
+				for i, result in enumerate(category.tests):
+					if result.bench is not None:
+						file_vars.write(result.bench.envs("BENCH_%s_%d" % (bench.env_name(category.category), i + 1)))
 
 	def clip_coefficients(self, categories: List[str] = None):
 		if categories is None or len(categories) == 0 or len(self.results) == 0:
@@ -325,17 +907,9 @@ class AllResult:
 
 		print("\t".join(map(str, categories)))
 
-		counts = []
-		for count in categories:
-			total = 0
-			passed = 0
-			for category in self.results:
-				for result in category.tests:
-					if count in result.categories:
-						total += 1
-						if result.is_pass:
-							passed += 1
-			counts.append(passed / total)
+		_, index = self.__indexed()
+		ratios = index.ratios(self.__passed_column(), categories)
+		counts = [ratios[count] for count in categories]
 
 		counts_str = "\t".join(map(str, counts))
 		print(counts_str)
@@ -361,7 +935,7 @@ class AllResult:
 	def get_total(self):
 		return self.__get_total()
 
-class AllTester:
+class AllTester(batch.SuiteRuns):
 	def __init__(self):
 		self.testers: List[RegexTester] = []
 
@@ -378,8 +952,9 @@ class AllTester:
 				new_testers.append(new_tester)
 		self.testers = new_testers
 
-	def run(self) -> AllResult:
-		start = get_time()
-		results = [tester.run() for tester in self.testers]
-		end = get_time()
-		return AllResult(results, end - start)
+	# Time of suite is span of its tests (see batch.Span).
+	def _result(self, categories: List[CategoryResult], timer: int) -> AllResult:
+		return AllResult(categories, timer)
+
+	def _tests(self, category: CategoryResult) -> List[TestResult]:
+		return category.tests
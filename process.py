@@ -0,0 +1,817 @@
+import asyncio
+import codecs
+import contextlib
+import hashlib
+import locale
+import mmap
+import os
+import resource
+import select
+import selectors
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from enum import Enum
+from typing import Dict, List, IO, Tuple, Union
+
+from suite import config
+from suite import tools
+
+# Output sinks.
+
+CHUNK_SIZE = 64 * 1024
+
+# Incremental equivalent of tools.decode_output, safe to feed with arbitrary chunks.
+class TextDecoder:
+	def __init__(self):
+		self.decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))()
+		self.pending_cr = False
+
+	def decode(self, chunk: bytes, final: bool = False) -> str:
+		text = self.decoder.decode(chunk, final)
+		if self.pending_cr:
+			text = "\r" + text
+			self.pending_cr = False
+		# "\r" at the end of chunk may be the first half of "\r\n".
+		if not final and text.endswith("\r"):
+			text = text[:-1]
+			self.pending_cr = True
+		return text.replace("\r\n", "\n").replace("\r", "\n")
+
+# Keeps output in memory until spill_threshold bytes, then moves it to a temporary file.
+# Spilled output is decoded straight from the file mapped to memory. With expected text
+# it is compared by chunks instead: equal output is expected text itself, differing one
+# is only a preview with divergence set, so large output is never held whole.
+class TextSink:
+	def __init__(self, spill_threshold: int = None, expected: str = None):
+		self.spill_threshold = spill_threshold or config.SPILL_THRESHOLD
+		self.expected = expected
+		self.chunks: List[bytes] = []
+		self.size = 0
+		self.spill: IO[bytes] = None
+		self.divergence: int = None
+
+	def feed(self, chunk: bytes) -> bool:
+		self.size += len(chunk)
+		if self.spill is None and self.size > self.spill_threshold:
+			self.spill = tempfile.TemporaryFile()
+			self.spill.writelines(self.chunks)
+			self.chunks = []
+		if self.spill is not None:
+			self.spill.write(chunk)
+		else:
+			self.chunks.append(chunk)
+		return True
+
+	def value(self) -> str:
+		if self.spill is None:
+			return tools.decode_output(b"".join(self.chunks))
+		with self.spill:
+			self.spill.flush()
+			if self.expected is not None:
+				return self.__compare_spilled()
+			with mmap.mmap(self.spill.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+				return tools.decode_output(mapped)
+
+	def __compare_spilled(self) -> str:
+		self.spill.seek(0)
+		decoder = TextDecoder()
+		offset = 0
+		while True:
+			chunk = self.spill.read(CHUNK_SIZE)
+			text = decoder.decode(chunk, final = not chunk)
+			expected = self.expected[offset:offset + len(text)]
+			if text != expected:
+				# Shorter expected slice means that output is longer than expected.
+				self.divergence = offset + len(os.path.commonprefix([text, expected]))
+				break
+			offset += len(text)
+			if not chunk:
+				# Like asserts.Actual, missing trailing newline of output is no difference.
+				if offset == len(self.expected) or (offset == len(self.expected) - 1 and self.expected.endswith("\n")):
+					return self.expected
+				self.divergence = offset
+				break
+		self.spill.seek(0)
+		return tools.decode_output(self.spill.read(config.PREVIEW_LENGTH), errors = "replace") + "..."
+
+# Throws output away, for runs where only time and exitcode matter.
+class NullSink:
+	def feed(self, chunk: bytes) -> bool:
+		return True
+
+	def value(self) -> str:
+		return None
+
+# Hashes output as it arrives. Digest is the same as SHA-256 of text mode output
+# encoded to UTF-8, with trailing newline added like asserts.Expected does.
+class Sha256Sink:
+	def __init__(self):
+		self.decoder = TextDecoder()
+		self.hash = hashlib.sha256()
+		self.last = ""
+
+	def __update(self, text: str):
+		if text:
+			self.hash.update(text.encode("utf-8"))
+			self.last = text[-1]
+
+	def feed(self, chunk: bytes) -> bool:
+		self.__update(self.decoder.decode(chunk))
+		return True
+
+	def value(self) -> str:
+		self.__update(self.decoder.decode(b"", final = True))
+		if self.last and self.last != "\n":
+			self.hash.update(b"\n")
+		return self.hash.hexdigest()
+
+# Compares output with expected text as it arrives and stops at the first difference.
+class CompareSink:
+	def __init__(self, expected: str):
+		self.expected = expected
+		self.decoder = TextDecoder()
+		self.chunks: List[str] = []
+		self.offset = 0
+		self.divergence: int = None
+
+	def __compare(self, text: str) -> bool:
+		expected = self.expected[self.offset:self.offset + len(text)]
+		self.chunks.append(text)
+		if text != expected:
+			# Shorter expected slice means that output is longer than expected.
+			self.divergence = self.offset + len(os.path.commonprefix([text, expected]))
+			return False
+		self.offset += len(text)
+		return True
+
+	def feed(self, chunk: bytes) -> bool:
+		return self.__compare(self.decoder.decode(chunk))
+
+	def value(self) -> str:
+		# Difference in the tail is left to the regular comparison.
+		self.chunks.append(self.decoder.decode(b"", final = True))
+		return "".join(self.chunks)
+
+# Compares output byte for byte with golden file mapped to memory, so neither side
+# is loaded fully. Like asserts.Expected, missing trailing newline is added on both sides.
+class GoldenSink:
+	def __init__(self, path: str):
+		self.path = path
+		with open(path, "rb") as file:
+			self.size = os.fstat(file.fileno()).st_size
+			self.golden = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) if self.size > 0 else b""
+		self.length = self.size + (1 if self.size > 0 and self.golden[self.size - 1] != ord("\n") else 0)
+		self.offset = 0
+		self.last = b""
+		self.head = bytearray()
+		self.divergence: int = None
+
+	def __expected(self, start: int, end: int) -> bytes:
+		expected = self.golden[start:end]
+		if start <= self.size < end and self.length > self.size:
+			expected += b"\n"
+		return expected
+
+	def __compare(self, chunk: bytes) -> bool:
+		expected = self.__expected(self.offset, self.offset + len(chunk))
+		if chunk != expected:
+			self.divergence = self.offset + len(os.path.commonprefix([chunk, expected]))
+			return False
+		self.offset += len(chunk)
+		self.last = chunk[-1:]
+		return True
+
+	def feed(self, chunk: bytes) -> bool:
+		if len(self.head) < config.PREVIEW_LENGTH:
+			self.head += chunk[:config.PREVIEW_LENGTH - len(self.head)]
+		return self.__compare(chunk)
+
+	def value(self) -> str:
+		if self.divergence is None:
+			if self.last not in (b"", b"\n"):
+				self.__compare(b"\n")
+			if self.divergence is None and self.offset != self.length:
+				self.divergence = self.offset
+		if isinstance(self.golden, mmap.mmap):
+			self.golden.close()
+		return tools.decode_output(bytes(self.head), errors = "replace")
+
+# Stops the program when stream gets more than limit bytes, remembering the beginning as preview.
+class CappedSink:
+	def __init__(self, sink, limit: int):
+		self.sink = sink
+		self.limit = limit
+		self.size = 0
+		self.head = bytearray()
+		self.exceeded = False
+
+	def feed(self, chunk: bytes) -> bool:
+		if len(self.head) < config.PREVIEW_LENGTH:
+			self.head += chunk[:config.PREVIEW_LENGTH - len(self.head)]
+		self.size += len(chunk)
+		if self.size > self.limit:
+			self.exceeded = True
+			return False
+		return self.sink.feed(chunk)
+
+	def preview(self) -> str:
+		preview = tools.decode_output(bytes(self.head), errors = "replace")
+		return preview + "..." if self.size > len(self.head) else preview
+
+	def value(self) -> str:
+		return self.sink.value()
+
+# Execution.
+
+class Status(Enum):
+	FINISHED = 0
+	TIMEOUT = 1
+	ABORTED = 2
+	OUTPUT_LIMIT = 3
+	MEMORY_LIMIT = 4
+	CPU_LIMIT = 5
+	FILE_SIZE_LIMIT = 6
+
+# Resource usage of single run. CPU time and peak RSS are known only for processes
+# reaped by os.wait4, which is not possible when asyncio reaps the child itself.
+class Usage:
+	def __init__(self, wall_us: int, user_us: int = None, sys_us: int = None, max_rss_kb: int = None, strays: int = 0, spawn_us: int = None, compare_us: int = None):
+		self.wall_us = wall_us
+		self.user_us = user_us
+		self.sys_us = sys_us
+		self.max_rss_kb = max_rss_kb
+		# Processes left in process group of program, stopped after it exited or timed out.
+		self.strays = strays
+		# Time of harness itself: starting program (part of wall time) and checking its output.
+		self.spawn_us = spawn_us
+		self.compare_us = compare_us
+
+	@staticmethod
+	def from_rusage(wall_us: int, rusage: resource.struct_rusage, strays: int = 0, spawn_us: int = None) -> 'Usage':
+		# ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+		max_rss_kb = rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+		return Usage(wall_us, int(rusage.ru_utime * 1000000), int(rusage.ru_stime * 1000000), max_rss_kb, strays, spawn_us)
+
+	def cpu_us(self) -> int:
+		if self.user_us is None:
+			return None
+		return self.user_us + self.sys_us
+
+	# Wall time of program after it was started.
+	def run_us(self) -> int:
+		return self.wall_us - (self.spawn_us or 0)
+
+	# Sums times and takes maximum of peak RSS over runs that have it.
+	@staticmethod
+	def summary(usages: List['Usage']) -> 'Usage':
+		usages = [usage for usage in usages if usage is not None]
+		measured = [usage for usage in usages if usage.user_us is not None]
+		strays = sum(usage.strays for usage in usages)
+		spawn_us = Usage.__known_sum([usage.spawn_us for usage in usages])
+		compare_us = Usage.__known_sum([usage.compare_us for usage in usages])
+		if len(measured) == 0:
+			return Usage(sum(usage.wall_us for usage in usages), strays = strays, spawn_us = spawn_us, compare_us = compare_us)
+		return Usage(
+			sum(usage.wall_us for usage in usages),
+			sum(usage.user_us for usage in measured),
+			sum(usage.sys_us for usage in measured),
+			max(usage.max_rss_kb for usage in measured),
+			strays,
+			spawn_us,
+			compare_us
+		)
+
+	# Sum of values that are known, None if none is.
+	@staticmethod
+	def __known_sum(values: List[int]) -> int:
+		known = [value for value in values if value is not None]
+		return sum(known) if len(known) > 0 else None
+
+	def str_cpu(self) -> str:
+		return "-" if self.user_us is None else "%.3f" % (self.cpu_us() / 1000)
+
+	def str_max_rss(self) -> str:
+		return "-" if self.max_rss_kb is None else str(self.max_rss_kb)
+
+	# Note on stray processes for summaries, empty if there were none.
+	def str_strays(self) -> str:
+		return "" if self.strays == 0 else ", %d stray processes stopped" % (self.strays)
+
+	# Time of harness apart from run time of program for summaries, empty if not measured.
+	def str_harness(self) -> str:
+		if self.spawn_us is None:
+			return ""
+		compare = "-" if self.compare_us is None else "%.3f" % (self.compare_us / 1000)
+		return ", spawn %.3f ms, run %.3f ms, compare %s ms" % (self.spawn_us / 1000, self.run_us() / 1000, compare)
+
+	def envs(self, prefix: str) -> str:
+		envs = "%s_WALL_US=%d\n" % (prefix, self.wall_us)
+		if self.user_us is not None:
+			envs += "%s_CPU_US=%d\n%s_MAX_RSS_KB=%d\n" % (prefix, self.cpu_us(), prefix, self.max_rss_kb)
+		if self.strays > 0:
+			envs += "%s_STRAYS=%d\n" % (prefix, self.strays)
+		if self.spawn_us is not None:
+			envs += "%s_SPAWN_US=%d\n%s_RUN_US=%d\n" % (prefix, self.spawn_us, prefix, self.run_us())
+		if self.compare_us is not None:
+			envs += "%s_COMPARE_US=%d\n" % (prefix, self.compare_us)
+		return envs
+
+# Sets limits given as comma separated resource:soft:hard and execs program, which
+# gets the rest of arguments.
+_WRAPPER = """
+import os, resource, sys
+for limit in sys.argv[1].split(","):
+	name, soft, hard = map(int, limit.split(":"))
+	resource.setrlimit(name, (soft, hard))
+try:
+	os.execv(sys.argv[2], sys.argv[2:])
+except OSError as err:
+	sys.exit("failed to execute %s: %s" % (sys.argv[2], err.strerror))
+"""
+
+# Resource limits, None means unlimited. Memory limit is in bytes of address space, CPU
+# time limit is in seconds, file size limit is in bytes. Process limit is RLIMIT_NPROC,
+# so it counts all processes of the user. Limits are set by exec wrapper started in place
+# of program (see wrap), so no Python code runs in child forked from threaded harness.
+class Limits:
+	# prlimit(1) of util-linux sets limits and execs program. Without it _WRAPPER run by
+	# a fresh interpreter (not a forked copy of harness) does the same.
+	PRLIMIT = shutil.which("prlimit")
+	PRLIMIT_NAMES = {resource.RLIMIT_AS: "as", resource.RLIMIT_CPU: "cpu", resource.RLIMIT_NPROC: "nproc", resource.RLIMIT_FSIZE: "fsize"}
+
+	# Error output of programs whose allocation has failed.
+	MEMORY_ERRORS = ("bad_alloc", "MemoryError", "out of memory", "Cannot allocate memory")
+
+	def __init__(self, memory_limit: int = None, cpu_time_limit: float = None, max_processes: int = None, max_file_size: int = None):
+		self.memory_limit = memory_limit
+		self.cpu_time_limit = cpu_time_limit
+		self.max_processes = max_processes
+		self.max_file_size = max_file_size
+
+	# Limits given here win, the rest is taken from defaults (usually limits of tester).
+	def merge(self, defaults: 'Limits') -> 'Limits':
+		if defaults is None:
+			return self
+		return Limits(
+			defaults.memory_limit if self.memory_limit is None else self.memory_limit,
+			defaults.cpu_time_limit if self.cpu_time_limit is None else self.cpu_time_limit,
+			defaults.max_processes if self.max_processes is None else self.max_processes,
+			defaults.max_file_size if self.max_file_size is None else self.max_file_size
+		)
+
+	def is_empty(self) -> bool:
+		return all(value is None for value in vars(self).values())
+
+	# Limits as (resource, soft, hard).
+	def __rlimits(self) -> List[Tuple[int, int, int]]:
+		rlimits = []
+		if self.memory_limit is not None:
+			rlimits.append((resource.RLIMIT_AS, self.memory_limit, self.memory_limit))
+		if self.cpu_time_limit is not None:
+			# SIGXCPU on soft limit, SIGKILL a second later if it is ignored.
+			seconds = max(1, int(-(-self.cpu_time_limit // 1)))
+			rlimits.append((resource.RLIMIT_CPU, seconds, seconds + 1))
+		if self.max_processes is not None:
+			rlimits.append((resource.RLIMIT_NPROC, self.max_processes, self.max_processes))
+		if self.max_file_size is not None:
+			rlimits.append((resource.RLIMIT_FSIZE, self.max_file_size, self.max_file_size))
+		return rlimits
+
+	# Command line running argv under limits. The wrapper execs program, so pid, process
+	# group and resource usage are those of program.
+	def wrap(self, argv: List[str]) -> List[str]:
+		if self.is_empty():
+			return argv
+		if Limits.PRLIMIT is not None:
+			return [Limits.PRLIMIT] + ["--%s=%d:%d" % (Limits.PRLIMIT_NAMES[name], soft, hard) for name, soft, hard in self.__rlimits()] + ["--"] + argv
+		return [sys.executable, "-I", "-S", "-c", _WRAPPER, ",".join("%d:%d:%d" % rlimit for rlimit in self.__rlimits())] + argv
+
+	# Which limit the finished program has run into, if any, judged only by evidence of it:
+	# SIGXFSZ for file size, SIGXCPU or CPU time over limit for CPU time. RLIMIT_AS only
+	# makes allocations fail, so memory breach is failed run with allocation error on error
+	# output (single large allocation fails at once, whatever the peak RSS), or crash by
+	# SIGSEGV or SIGABRT of program that has reached config.MEMORY_LIMIT_RATIO of limit
+	# by peak RSS.
+	def breach(self, exitcode: int, usage: Usage, stderr: str) -> Status:
+		if self.max_file_size is not None and exitcode == -signal.SIGXFSZ:
+			return Status.FILE_SIZE_LIMIT
+		if self.cpu_time_limit is not None:
+			if exitcode == -signal.SIGXCPU:
+				return Status.CPU_LIMIT
+			if usage.user_us is not None and usage.cpu_us() > self.cpu_time_limit * 1000000:
+				return Status.CPU_LIMIT
+		if self.memory_limit is not None and exitcode != 0:
+			if any(error in (stderr or "") for error in Limits.MEMORY_ERRORS):
+				return Status.MEMORY_LIMIT
+			if exitcode in (-signal.SIGSEGV, -signal.SIGABRT) and usage.max_rss_kb is not None and usage.max_rss_kb * 1024 >= self.memory_limit * config.MEMORY_LIMIT_RATIO:
+				return Status.MEMORY_LIMIT
+		return None
+
+	def str_breach(self, status: Status) -> str:
+		match status:
+			case Status.MEMORY_LIMIT: return "memory limit exceeded (%d bytes)" % (self.memory_limit)
+			case Status.CPU_LIMIT: return "CPU time limit exceeded (%g s)" % (self.cpu_time_limit)
+			case Status.FILE_SIZE_LIMIT: return "file size limit exceeded (%d bytes)" % (self.max_file_size)
+			case _: raise ValueError("Status is not a limit breach.")
+
+class Execution:
+	def __init__(self, stdout: str, stderr: str, exitcode: int, usage: Usage, status: Status = Status.FINISHED):
+		self.stdout = stdout
+		self.stderr = stderr
+		self.exitcode = exitcode
+		self.usage = usage
+		self.timer = usage.wall_us // 1000
+		self.status = status
+		self.timeout = status == Status.TIMEOUT
+		self.aborted = status == Status.ABORTED
+		self.output_limit = status == Status.OUTPUT_LIMIT
+		self.limit_exceeded = status in (Status.MEMORY_LIMIT, Status.CPU_LIMIT, Status.FILE_SIZE_LIMIT)
+
+def _capture(stdout_sink, max_output_bytes: int) -> Tuple[CappedSink, CappedSink]:
+	limit = max_output_bytes or config.DEFAULT_MAX_OUTPUT_BYTES
+	return CappedSink(stdout_sink or TextSink(), limit), CappedSink(TextSink(), limit)
+
+def _finish(stdout: CappedSink, stderr: CappedSink, exitcode: int, usage: Usage, status: Status) -> Execution:
+	if status == Status.TIMEOUT:
+		return Execution(None, None, None, usage, status)
+	if stdout.exceeded or stderr.exceeded:
+		return Execution(stdout.preview(), stderr.preview(), exitcode, usage, Status.OUTPUT_LIMIT)
+	return Execution(stdout.value(), stderr.value(), exitcode, usage, status)
+
+def _write_input(selector: selectors.BaseSelector, stream: IO[bytes], input: memoryview) -> memoryview:
+	try:
+		written = os.write(stream.fileno(), input[:select.PIPE_BUF])
+	except BrokenPipeError:
+		written = len(input)
+	input = input[written:]
+	if len(input) == 0:
+		selector.unregister(stream)
+		stream.close()
+	return input
+
+# Every program is started in its own session, so its process group has id of its pid
+# and holds everything it forked (unless that has started a session of its own).
+
+def _signal_group(pgid: int, signum: int):
+	try:
+		os.killpg(pgid, signum)
+	except (ProcessLookupError, PermissionError):
+		pass
+
+def _alive(pgid: int) -> bool:
+	try:
+		os.killpg(pgid, 0)
+	except (ProcessLookupError, PermissionError):
+		return False
+	return True
+
+# Whether pid is live (not zombie) process of group, by its /proc entry.
+def _live(pid: int, pgid: int) -> bool:
+	try:
+		with open("/proc/%d/stat" % (pid), "rb") as file:
+			stat = file.read()
+	except OSError:
+		return False
+	# Fields after command name (which may have spaces) are state, ppid and pgrp.
+	fields = stat[stat.rindex(b")") + 2:].split()
+	return int(fields[2]) == pgid and fields[0] != b"Z"
+
+def _scan(pgid: int, exclude: int = None) -> List[int]:
+	return [int(entry.name) for entry in os.scandir("/proc") if entry.name.isdigit() and int(entry.name) != exclude and _live(int(entry.name), pgid)]
+
+# Live processes of group other than exclude. They are counted in /proc, without it only
+# whether there are any is known, so none are counted besides exclude.
+def _members(pgid: int, exclude: int = None) -> int:
+	if not _alive(pgid):
+		return 0
+	if not os.path.isdir("/proc"):
+		return 1 if exclude is None else 0
+	return len(_scan(pgid, exclude))
+
+# Live processes of group out of pids (all of group when None). Group may hold zombies
+# nobody reaps, so once it is found by killpg only processes of one /proc scan are polled.
+# Without /proc, group is live while killpg finds it.
+def _remaining(pgid: int, pids: List[int] = None) -> List[int]:
+	if not _alive(pgid):
+		return []
+	if not os.path.isdir("/proc"):
+		return [pgid]
+	if pids is None:
+		return _scan(pgid)
+	return [pid for pid in pids if _live(pid, pgid)]
+
+# Waits until group has no live processes or deadline passes, polling with backoff.
+def _wait_group(pgid: int, deadline: float):
+	pids = _remaining(pgid)
+	delay = 0.0001
+	while len(pids) > 0:
+		remaining = deadline - time.monotonic()
+		if remaining <= 0:
+			return
+		time.sleep(min(delay, remaining))
+		delay = min(delay * 2, 0.01)
+		pids = _remaining(pgid, pids)
+
+async def _wait_group_async(pgid: int, deadline: float):
+	pids = _remaining(pgid)
+	delay = 0.0001
+	while len(pids) > 0:
+		remaining = deadline - time.monotonic()
+		if remaining <= 0:
+			return
+		await asyncio.sleep(min(delay, remaining))
+		delay = min(delay * 2, 0.01)
+		pids = _remaining(pgid, pids)
+
+# Stops processes left in group of reaped program: SIGTERM, then SIGKILL to those still
+# alive after config.KILL_GRACE seconds. Returns number of processes found.
+def _stop_strays(pgid: int) -> int:
+	strays = _members(pgid)
+	if strays > 0:
+		_signal_group(pgid, signal.SIGTERM)
+		_wait_group(pgid, time.monotonic() + config.KILL_GRACE)
+		_signal_group(pgid, signal.SIGKILL)
+	return strays
+
+async def _stop_strays_async(pgid: int) -> int:
+	strays = _members(pgid)
+	if strays > 0:
+		_signal_group(pgid, signal.SIGTERM)
+		await _wait_group_async(pgid, time.monotonic() + config.KILL_GRACE)
+		_signal_group(pgid, signal.SIGKILL)
+	return strays
+
+# Signals ignored by Python itself, restored to default in program as Popen does.
+_RESTORED_SIGNALS = tuple(getattr(signal, name) for name in ("SIGPIPE", "SIGXFZ", "SIGXFSZ") if hasattr(signal, name))
+
+# Program started by os.posix_spawn, with pid, raw binary pipes and returncode in place
+# of those of subprocess.Popen, for platforms where Popen forks (see config.POSIX_SPAWN).
+# Like Popen, it starts program in its own session.
+class _Spawned:
+	def __init__(self, argv: List[str], input_file: IO[bytes]):
+		self.returncode: int = None
+		stdin_read, stdin_write = (input_file.fileno(), None) if input_file is not None else os.pipe()
+		stdout_read, stdout_write = os.pipe()
+		stderr_read, stderr_write = os.pipe()
+		child = [stdout_write, stderr_write] + ([stdin_read] if input_file is None else [])
+		try:
+			actions = [(os.POSIX_SPAWN_DUP2, stdin_read, 0), (os.POSIX_SPAWN_DUP2, stdout_write, 1), (os.POSIX_SPAWN_DUP2, stderr_write, 2)]
+			self.pid = os.posix_spawn(argv[0], argv, os.environ, file_actions = actions, setsid = True, setsigdef = _RESTORED_SIGNALS)
+		except BaseException:
+			for fd in [stdin_write, stdout_read, stderr_read]:
+				if fd is not None:
+					os.close(fd)
+			raise
+		finally:
+			for fd in child:
+				os.close(fd)
+		self.stdin = None if stdin_write is None else open(stdin_write, "wb", buffering = 0)
+		self.stdout = open(stdout_read, "rb", buffering = 0)
+		self.stderr = open(stderr_read, "rb", buffering = 0)
+
+	def __enter__(self) -> '_Spawned':
+		return self
+
+	def __exit__(self, *_):
+		for stream in (self.stdin, self.stdout, self.stderr):
+			if stream is not None:
+				stream.close()
+
+# Programs are started by Popen when posix_spawn is not available.
+def _start(argv: List[str], input_file: IO[bytes], limits: Limits):
+	if limits is not None:
+		argv = limits.wrap(argv)
+	if config.POSIX_SPAWN and hasattr(os, "posix_spawn"):
+		try:
+			return _Spawned(argv, input_file)
+		# Platform without setsid or setsigdef of posix_spawn.
+		except NotImplementedError:
+			pass
+	return subprocess.Popen(argv, stdout = subprocess.PIPE, stdin = input_file or subprocess.PIPE, stderr = subprocess.PIPE, start_new_session = True)
+
+# Popen.kill polls the program first and may reap it, which would lose its rusage
+# for os.wait4. Until the program is reaped its pid (and so its group) cannot be reused,
+# reaped one is not signalled.
+def _kill(program: subprocess.Popen):
+	if program.returncode is None:
+		_signal_group(program.pid, signal.SIGKILL)
+
+# Reads output until its streams end or deadline passes. With pidfd of program, reading
+# stops also once program exits, as processes it has left may hold its output open.
+def _communicate(program: subprocess.Popen, input: bytes, deadline: float, sinks: Dict[IO[bytes], object], pidfd: int = None) -> Status:
+	status = Status.FINISHED
+	with selectors.DefaultSelector() as selector:
+		pending = memoryview(input or b"")
+		if len(pending) > 0:
+			selector.register(program.stdin, selectors.EVENT_WRITE)
+		elif program.stdin is not None:
+			program.stdin.close()
+		for stream in sinks:
+			selector.register(stream, selectors.EVENT_READ)
+		if pidfd is not None:
+			selector.register(pidfd, selectors.EVENT_READ)
+
+		while len(selector.get_map()) > (0 if pidfd is None else 1):
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				return Status.TIMEOUT
+			for key, _ in selector.select(remaining):
+				if key.fd == pidfd:
+					return status
+				if key.fileobj is program.stdin:
+					pending = _write_input(selector, program.stdin, pending)
+					continue
+				chunk = os.read(key.fd, CHUNK_SIZE)
+				if not chunk:
+					selector.unregister(key.fileobj)
+					key.fileobj.close()
+				elif not sinks[key.fileobj].feed(chunk):
+					# Sink has seen enough: stop the program, but still drain the other streams.
+					_kill(program)
+					selector.unregister(key.fileobj)
+					key.fileobj.close()
+					status = Status.ABORTED
+	return status
+
+def _pidfd_open(pid: int) -> int:
+	try:
+		return os.pidfd_open(pid)
+	except (AttributeError, OSError):
+		return None
+
+# Reaps program with os.wait4 to get its resource usage. Returns None if deadline passes first.
+def _reap(program: subprocess.Popen, deadline: float = None) -> resource.struct_rusage:
+	if deadline is None:
+		_, status, rusage = os.wait4(program.pid, 0)
+		program.returncode = os.waitstatus_to_exitcode(status)
+		return rusage
+	# pidfd becomes readable on exit, without it fall back to polling with backoff.
+	pidfd = _pidfd_open(program.pid)
+	delay = 0.0001
+	try:
+		while True:
+			pid, status, rusage = os.wait4(program.pid, os.WNOHANG)
+			if pid == program.pid:
+				program.returncode = os.waitstatus_to_exitcode(status)
+				return rusage
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				return None
+			if pidfd is not None:
+				select.select([pidfd], [], [], remaining)
+			else:
+				time.sleep(min(delay, remaining))
+				delay = min(delay * 2, 0.01)
+	finally:
+		if pidfd is not None:
+			os.close(pidfd)
+
+# Input is either bytes written to stdin or path to file attached to stdin as is.
+def _open_input(input: Union[bytes, str]) -> Tuple[bytes, IO[bytes]]:
+	if isinstance(input, str):
+		return None, open(input, "rb")
+	return input, None
+
+def _check_limits(execution: Execution, limits: Limits) -> Execution:
+	if execution.status != Status.FINISHED or limits is None:
+		return execution
+	breach = limits.breach(execution.exitcode, execution.usage, execution.stderr)
+	if breach is None:
+		return execution
+	return Execution(execution.stdout, execution.stderr, execution.exitcode, execution.usage, breach)
+
+def execute(argv: List[str], input: Union[bytes, str], timeout: float, stdout_sink = None, max_output_bytes: int = None, limits: Limits = None) -> Execution:
+	stdout, stderr = _capture(stdout_sink, max_output_bytes)
+	input, input_file = _open_input(input)
+	start = time.monotonic_ns()
+	deadline = time.monotonic() + timeout
+	with input_file or contextlib.nullcontext():
+		program = _start(argv, input_file, limits)
+	spawn_us = (time.monotonic_ns() - start) // 1000
+	sinks = {program.stdout: stdout, program.stderr: stderr}
+	pidfd = _pidfd_open(program.pid)
+	with program:
+		try:
+			status = _communicate(program, input, deadline, sinks, pidfd)
+		except BaseException:
+			# Program does not get SIGINT of terminal in its own session.
+			_kill(program)
+			_reap(program)
+			raise
+		finally:
+			if pidfd is not None:
+				os.close(pidfd)
+		rusage = None
+		if status != Status.TIMEOUT:
+			rusage = _reap(program, deadline)
+		strays = 0
+		if rusage is None:
+			# Timeout: whole group gets SIGTERM and, after grace period, SIGKILL.
+			status = Status.TIMEOUT
+			strays = _members(program.pid, exclude = program.pid)
+			grace = time.monotonic() + config.KILL_GRACE
+			_signal_group(program.pid, signal.SIGTERM)
+			rusage = _reap(program, grace)
+			_wait_group(program.pid, grace)
+			_signal_group(program.pid, signal.SIGKILL)
+			if rusage is None:
+				rusage = _reap(program)
+		else:
+			strays = _stop_strays(program.pid)
+			# Rest of output, held open by now stopped processes or not read yet.
+			drained = _communicate(program, None, deadline, {stream: sink for stream, sink in sinks.items() if not stream.closed})
+			if drained != Status.FINISHED:
+				status = drained
+	end = time.monotonic_ns()
+	usage = Usage.from_rusage((end - start) // 1000, rusage, strays, spawn_us)
+	return _check_limits(_finish(stdout, stderr, program.returncode, usage, status), limits)
+
+async def _write_input_async(stream: asyncio.StreamWriter, input: bytes):
+	if stream is None:
+		return
+	try:
+		if input:
+			stream.write(input)
+			await stream.drain()
+		stream.close()
+	except (BrokenPipeError, ConnectionResetError):
+		pass
+
+async def _read_output_async(program: asyncio.subprocess.Process, stream: asyncio.StreamReader, sink) -> Status:
+	status = Status.FINISHED
+	while True:
+		chunk = await stream.read(CHUNK_SIZE)
+		if not chunk:
+			return status
+		if status == Status.FINISHED and not sink.feed(chunk):
+			# Sink has seen enough: stop the program and discard the rest.
+			_signal_group(program.pid, signal.SIGKILL)
+			status = Status.ABORTED
+
+# Unlike Process.wait, returns once program exits even if its output is still held open.
+# Without pidfd (or once program is reaped) returncode is polled with backoff.
+async def _exited_async(program: asyncio.subprocess.Process):
+	pidfd = _pidfd_open(program.pid)
+	if pidfd is None:
+		delay = 0.0001
+		while program.returncode is None:
+			await asyncio.sleep(delay)
+			delay = min(delay * 2, 0.01)
+		return
+	loop = asyncio.get_running_loop()
+	exited = loop.create_future()
+	loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+	try:
+		await exited
+	finally:
+		loop.remove_reader(pidfd)
+		os.close(pidfd)
+
+# Output is read until program exits, then processes it has left (which may hold output
+# open) are stopped and the rest is read. Returns status and number of those processes.
+async def _communicate_async(program: asyncio.subprocess.Process, input: bytes, stdout, stderr) -> Tuple[Status, int]:
+	communicate = asyncio.gather(
+		_read_output_async(program, program.stdout, stdout),
+		_read_output_async(program, program.stderr, stderr),
+		_write_input_async(program.stdin, input)
+	)
+	try:
+		await _exited_async(program)
+		strays = await _stop_strays_async(program.pid)
+		stdout_status, stderr_status, _ = await communicate
+	except asyncio.CancelledError:
+		communicate.cancel()
+		with contextlib.suppress(asyncio.CancelledError):
+			await communicate
+		raise
+	await program.wait()
+	return Status.ABORTED if Status.ABORTED in (stdout_status, stderr_status) else Status.FINISHED, strays
+
+async def execute_async(argv: List[str], input: Union[bytes, str], timeout: float, stdout_sink = None, max_output_bytes: int = None, limits: Limits = None) -> Execution:
+	stdout, stderr = _capture(stdout_sink, max_output_bytes)
+	input, input_file = _open_input(input)
+	start = time.monotonic_ns()
+	with input_file or contextlib.nullcontext():
+		program = await asyncio.create_subprocess_exec(*(argv if limits is None else limits.wrap(argv)), stdout = asyncio.subprocess.PIPE, stdin = input_file or asyncio.subprocess.PIPE, stderr = asyncio.subprocess.PIPE, start_new_session = True)
+	spawn_us = (time.monotonic_ns() - start) // 1000
+	try:
+		status, strays = await asyncio.wait_for(_communicate_async(program, input, stdout, stderr), timeout = timeout)
+	except asyncio.TimeoutError:
+		# Whole group gets SIGTERM and, after grace period, SIGKILL.
+		status = Status.TIMEOUT
+		strays = _members(program.pid, exclude = program.pid)
+		grace = time.monotonic() + config.KILL_GRACE
+		_signal_group(program.pid, signal.SIGTERM)
+		await _wait_group_async(program.pid, grace)
+		_signal_group(program.pid, signal.SIGKILL)
+		await program.wait()
+	except asyncio.CancelledError:
+		_signal_group(program.pid, signal.SIGKILL)
+		raise
+	end = time.monotonic_ns()
+	usage = Usage((end - start) // 1000, strays = strays, spawn_us = spawn_us)
+	return _check_limits(_finish(stdout, stderr, program.returncode, usage, status), limits)
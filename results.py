@@ -1,83 +1,133 @@
+import array
+import sys
 import pyperclip
-from typing import List, Union, Dict
+from typing import Any, List, Tuple, Union, Dict
 
+from suite import batch
+from suite import bench
+from suite import config
+from suite import process
+from suite import store
 from suite import tools
 
 # Results.
 
+# Slots and shared category tuples keep results of large suites small. Numbers are kept
+# in columns (see tools.Columns): of its own until result is collected into category,
+# then of category (see attach).
 class TestResult():
+	__slots__ = ("columns", "row", "name", "is_success", "raw_input", "raw_actual_output", "raw_expected_output", "empty_error", "error_message", "categories", "usage", "verdict", "bench")
+
+	FIELDS: Dict[str, str] = {"passed": "b", "timer": "q", "exitcode": "q"}
+
 	STR_PASSED_TRUE: str = "PASS"
 	STR_PASSED_FALSE: str = "FAIL"
+	STR_VERDICTS: Dict[process.Status, str] = {
+		process.Status.TIMEOUT: "TLE",
+		process.Status.OUTPUT_LIMIT: "OLE",
+		process.Status.MEMORY_LIMIT: "MLE",
+		process.Status.CPU_LIMIT: "CPU",
+		process.Status.FILE_SIZE_LIMIT: "FSZ",
+	}
 	STR_IS_SUCCESS_TRUE: str = "NO"
 	STR_IS_SUCCESS_FALSE: str = "YES"
 	STR_EMPTY_ERROR_TRUE: str = "<empty>"
 	STR_EMPTY_ERROR_FALSE: str = "<not empty>"
 
-	def __init__(self, passed: bool, name: str, is_success: bool, input: str, actual_output: str, expected_output: Union[List[str], str], empty_error: bool, timer: int, exitcode: int, error_message: str = None, categories: List[str] = []):
-		self.passed = passed
+	def __init__(self, passed: bool, name: str, is_success: bool, input: str, actual_output: str, expected_output: Union[List[str], str], empty_error: bool, timer: int, exitcode: int, error_message: str = None, categories: List[str] = [], usage: process.Usage = None, verdict: process.Status = None):
+		self.columns = tools.Columns(TestResult.FIELDS)
+		self.row = self.columns.append({"passed": passed, "timer": timer, "exitcode": exitcode})
 		self.name = "<no name>"
 		if name:
 			self.name = name
 		self.is_success = is_success
-		self.input = tools.escape(input)
-		self.actual_output = "<no output>"
-		if actual_output:
-			self.actual_output = tools.escape(actual_output)
-		self.expected_output = "<no reference>"
-		if expected_output:
-			if isinstance(expected_output, str):
-				self.expected_output = tools.escape(expected_output)
-			else:
-				self.expected_output = tools.escape_multi_or(expected_output)
+		# Texts are kept raw and escaped only when shown. Passed test keeps only previews
+		# of its texts, failed one keeps them whole.
+		length = config.PREVIEW_LENGTH if passed else None
+		self.raw_input = TestResult.__preview(input, length)
+		self.raw_actual_output = tools.truncate(actual_output, config.PREVIEW_LENGTH)
+		if expected_output is None or isinstance(expected_output, str):
+			self.raw_expected_output = TestResult.__preview(expected_output, length)
+		else:
+			self.raw_expected_output = tuple(TestResult.__preview(option, length) for option in expected_output)
 		self.empty_error = empty_error
-		self.timer = timer
-		self.exitcode = exitcode
 		self.error_message = error_message
-		self.categories = categories
-
-	def __print_end(self, end: bool):
-		if end:
-			print(" |")
-		else:
-			print(" ", end = "")
-
-	def __print_str(self, string: str, width: bool, end: bool):
-		print("| ", end = "")
-		print(string, " " * (width - len(string)), end = "" , sep = "")
-		self.__print_end(end)
-
-	def __print_bool(self, flag: bool, true_str: str, false_str: str, width: int, end: bool):
-		if flag:
-			self.__print_str(true_str, width, end)
-		else:
-			self.__print_str(false_str, width, end)
-
-	def print_passed(self, width: int, end = False):
-		self.__print_bool(self.passed, TestResult.STR_PASSED_TRUE, TestResult.STR_PASSED_FALSE, width, end)
-
-	def print_name(self, width: int, end = False):
-		self.__print_str(self.name, width, end)
-
-	def print_is_success(self, width: int, end = False):
-		self.__print_bool(self.is_success, TestResult.STR_IS_SUCCESS_TRUE, TestResult.STR_IS_SUCCESS_FALSE, width, end)
-
-	def print_input(self, width: int, end = False):
-		self.__print_str(self.input, width, end)
-
-	def print_actual_output(self, width: int, end = False):
-		self.__print_str(self.actual_output, width, end)
-
-	def print_expected_output(self, width: str, end = False):
-		self.__print_str(self.expected_output, width, end)
-
-	def print_empty_error(self, width: str, end = False):
-		self.__print_bool(self.empty_error, TestResult.STR_EMPTY_ERROR_TRUE, TestResult.STR_EMPTY_ERROR_FALSE, width, end)
-
-	def print_exitcode(self, width: str, end = False):
-		self.__print_str(str(self.exitcode), width, end)
-
-	def print_timer(self, width: str, end = False):
-		self.__print_str(str(self.timer), width, end)
+		self.categories = tools.intern(tuple(categories))
+		self.usage = usage
+		# Set when program has run into one of limits instead of giving wrong answer.
+		self.verdict = verdict
+		self.bench: bench.Benchmark = None
+
+	@staticmethod
+	def __preview(text: str, length: int) -> str:
+		return text if length is None else tools.truncate(text, length)
+
+	# Moves numbers of result to columns of its category.
+	def attach(self, columns: tools.Columns):
+		self.row = columns.append(self.columns.row(self.row))
+		self.columns = columns
+
+	@property
+	def passed(self) -> bool:
+		return bool(self.columns.get("passed", self.row))
+
+	@passed.setter
+	def passed(self, passed: bool):
+		self.columns.set("passed", self.row, passed)
+
+	@property
+	def timer(self) -> int:
+		return self.columns.get("timer", self.row)
+
+	@property
+	def exitcode(self) -> int:
+		return self.columns.get("exitcode", self.row)
+
+	# Finished run which has been compared, verdicts of timeout and limits depend on
+	# machine and load. Result without usage has no run of program (reference has failed).
+	def is_definitive(self) -> bool:
+		return self.verdict is None and self.usage is not None
+
+	@property
+	def input(self) -> str:
+		return tools.escape(self.raw_input)
+
+	@property
+	def actual_output(self) -> str:
+		if not self.raw_actual_output:
+			return "<no output>"
+		return tools.escape(self.raw_actual_output)
+
+	@property
+	def expected_output(self) -> str:
+		if not self.raw_expected_output:
+			return "<no reference>"
+		if isinstance(self.raw_expected_output, str):
+			return tools.escape(self.raw_expected_output)
+		return tools.escape_multi_or(self.raw_expected_output)
+
+	def str_is_success(self) -> str:
+		return TestResult.STR_IS_SUCCESS_TRUE if self.is_success else TestResult.STR_IS_SUCCESS_FALSE
+
+	def str_empty_error(self) -> str:
+		return TestResult.STR_EMPTY_ERROR_TRUE if self.empty_error else TestResult.STR_EMPTY_ERROR_FALSE
+
+	# Texts of all columns of table row, escaped once.
+	def cells(self) -> List[str]:
+		return [self.str_passed(), self.name, self.str_is_success(), self.input, self.actual_output, self.expected_output, self.str_empty_error(), str(self.exitcode), str(self.timer), self.str_cpu(), self.str_max_rss()]
+
+	def str_passed(self) -> str:
+		if self.passed:
+			return TestResult.STR_PASSED_TRUE
+		if self.verdict is None:
+			return TestResult.STR_PASSED_FALSE
+		return "%s (%s)" % (TestResult.STR_PASSED_FALSE, TestResult.STR_VERDICTS[self.verdict])
+
+	def str_cpu(self) -> str:
+		return "-" if self.usage is None else self.usage.str_cpu()
+
+	def str_max_rss(self) -> str:
+		return "-" if self.usage is None else self.usage.str_max_rss()
 
 class CategoryResult():
 	STR_PASSED = "Status"
@@ -89,147 +139,137 @@ class CategoryResult():
 	STR_EMPTY_ERROR = "Is error output empty?"
 	STR_EXITCODE = "Exitcode"
 	STR_TIMER = "Time (in ms)"
+	STR_CPU = "CPU (in ms)"
+	STR_MAX_RSS = "Peak RSS (in KB)"
 
 	def __init__(self, results: List[TestResult], category: str):
 		self.results = results
-		self.passed = sum(1 for result in self.results if result.passed)
+		# Numbers of every test are kept here, totals are taken from them.
+		self.columns = tools.Columns(TestResult.FIELDS)
+		for result in self.results:
+			result.attach(self.columns)
+		self.passed = sum(self.columns.column("passed"))
 		self.total = len(self.results)
 		self.category = category
-		self.timer = sum([result.timer for result in self.results])
-
-	def __print_cat(self, cat: str, width: int, begin: bool = False, end: bool = False):
-		if begin:
-			print("| ", end = "")
-		print(cat, " " * (width - len(cat)), end = "", sep = "")
-		if end:
-			print(" |")
-		else:
-			print(" | ", end = "")
-
-	def width_passed(self):
-		return max(len(TestResult.STR_PASSED_TRUE) if result.passed else len(TestResult.STR_PASSED_FALSE) for result in self.results)
-
-	def width_category(self):
-		return len(self.category)
-
-	def width_name(self):
-		return max(len(result.name) for result in self.results)
-
-	def width_is_success(self):
-		return max(len(TestResult.STR_IS_SUCCESS_TRUE) if result.is_success else len(TestResult.STR_IS_SUCCESS_FALSE) for result in self.results)
+		self.timer = sum(self.columns.column("timer"))
+		self.usage = process.Usage.summary([result.usage for result in self.results])
 
-	def width_input(self):
-		return max(len(result.input) for result in self.results)
+	def to_dict(self) -> Dict[str, Any]:
+		return {"category": self.category, "passed": self.passed, "total": self.total, "timer": self.timer}
 
-	def width_actual_output(self):
-		return max(len(result.actual_output) for result in self.results)
+	HEADER = [STR_PASSED, STR_NAME, STR_IS_SUCCESS, STR_INPUT, STR_ACTUAL_OUTPUT, STR_EXPECTED_OUTPUT, STR_EMPTY_ERROR, STR_EXITCODE, STR_TIMER, STR_CPU, STR_MAX_RSS]
 
-	def width_expected_output(self):
-		return max(len(result.expected_output) for result in self.results)
+	def cells(self) -> List[List[str]]:
+		return [result.cells() for result in self.results]
 
-	def width_empty_error(self):
-		return max(len(TestResult.STR_EMPTY_ERROR_TRUE) if result.empty_error else len(TestResult.STR_EMPTY_ERROR_TRUE) for result in self.results)
+	# Cell padded (or cut with "...") to width.
+	@staticmethod
+	def __fit(cell: str, width: int) -> str:
+		if len(cell) > width:
+			return cell[:max(width - 3, 0)] + "..."[:width]
+		return cell.ljust(width)
 
-	def width_exitcode(self):
-		return max(len(str(result.exitcode)) for result in self.results)
+	@staticmethod
+	def __row(cells: List[str], widths: List[int]) -> str:
+		return "| " + " | ".join(CategoryResult.__fit(cell, width) for cell, width in zip(cells, widths)) + " |\n"
 
-	def width_timer(self):
-		return max(len(str(result.timer)) for result in self.results)
-
-	def print(self, width: int, width_passed: int, width_name: int, width_is_success: int, width_input: int, width_actual_output: int, width_expected_output: int, width_empty_error: int, width_exitcode: int, width_timer: int, header_head: bool = True):
-		# number of symbols
-		num_cats: int = 9
-		in_spaces: int = 2 * num_cats
-		count: int = width + in_spaces + num_cats + 1
-
-		# headers
-		header_head_str: str = "+" + "-" * (count - 2) + "+"
-		header_sub_str: str = "+" + "-" * (width_passed + 2) + "+" + "-" * (width_name + 2) + "+" + "-" * (width_is_success + 2) + "+" + "-" * (width_input + 2) + "+" + "-" * (width_actual_output + 2) + "+" + "-" * (width_expected_output + 2) + "+" + "-" * (width_empty_error + 2) + "+" + "-" * (width_exitcode + 2) + "+" + "-" * (width_timer + 2) + "+"
-
-		# head
+	# Whole table of category as one string, rows are cells of results (see cells()).
+	def render(self, widths: List[int], rows: List[List[str]], header_head: bool = True) -> str:
+		count = sum(widths) + 3 * len(widths) + 1
+		header_sub_str = "+" + "+".join("-" * (width + 2) for width in widths) + "+\n"
+		lines = []
 		if header_head:
-			print(header_head_str)
-
-		# name of category
-		print("| ", end = "")
-		print(self.category, " " * (count - len(self.category) - 4), end = "" , sep = "")
-		print(" |")
-
-		# subcategories
-		print(header_sub_str)
-		self.__print_cat(CategoryResult.STR_PASSED, width_passed, begin = True)
-		self.__print_cat(CategoryResult.STR_NAME, width_name)
-		self.__print_cat(CategoryResult.STR_IS_SUCCESS, width_is_success)
-		self.__print_cat(CategoryResult.STR_INPUT, width_input)
-		self.__print_cat(CategoryResult.STR_ACTUAL_OUTPUT, width_actual_output)
-		self.__print_cat(CategoryResult.STR_EXPECTED_OUTPUT, width_expected_output)
-		self.__print_cat(CategoryResult.STR_EMPTY_ERROR, width_empty_error)
-		self.__print_cat(CategoryResult.STR_EXITCODE, width_exitcode)
-		self.__print_cat(CategoryResult.STR_TIMER, width_timer, end = True)
-		print(header_sub_str)
-
-		# results
-		for result in self.results:
-			result.print_passed(width_passed)
-			result.print_name(width_name)
-			result.print_is_success(width_is_success)
-			result.print_input(width_input)
-			result.print_actual_output(width_actual_output)
-			result.print_expected_output(width_expected_output)
-			result.print_empty_error(width_empty_error)
-			result.print_exitcode(width_exitcode)
-			result.print_timer(width_timer, end = True)
-		print(header_sub_str)
+			lines.append("+" + "-" * (count - 2) + "+\n")
+		lines.append("| " + CategoryResult.__fit(self.category, count - 4) + " |\n")
+		lines.append(header_sub_str)
+		lines.append(CategoryResult.__row(CategoryResult.HEADER, widths))
+		lines.append(header_sub_str)
+		lines.extend(CategoryResult.__row(row, widths) for row in rows)
+		lines.append(header_sub_str)
+		return "".join(lines)
+
+	def print(self, width: int, width_passed: int, width_name: int, width_is_success: int, width_input: int, width_actual_output: int, width_expected_output: int, width_empty_error: int, width_exitcode: int, width_timer: int, width_cpu: int, width_max_rss: int, header_head: bool = True):
+		widths = [width_passed, width_name, width_is_success, width_input, width_actual_output, width_expected_output, width_empty_error, width_exitcode, width_timer, width_cpu, width_max_rss]
+		sys.stdout.write(self.render(widths, self.cells(), header_head))
 
 class TesterResult():
 	def __init__(self, categories: List[CategoryResult]):
 		self.categories = categories
 		self.passed = sum(category.passed for category in self.categories)
 		self.total = sum(category.total for category in self.categories)
+		self.flat: List[TestResult] = None
+		self.index: tools.CategoryIndex = None
+
+	# Result of whole suite from result files of all its shards (see MegaTester.run_shard).
+	@staticmethod
+	def merge(filenames: List[str]) -> 'TesterResult':
+		shards = [store.ShardResult.load(filename) for filename in filenames]
+		return TesterResult([CategoryResult(results, name) for name, results, _ in batch.merge(shards)])
 
 	def is_passed(self):
 		return self.passed == self.total
 
+	# Results of all categories in one list with index of their categories, built once.
+	def __indexed(self) -> Tuple[List[TestResult], tools.CategoryIndex]:
+		if self.index is None:
+			self.flat = [result for category in self.categories for result in category.results]
+			self.index = tools.CategoryIndex([result.categories for result in self.flat])
+		return self.flat, self.index
+
+	# Pass flags of all results in order of __indexed.
+	def __passed_column(self) -> array.array:
+		column = array.array("b")
+		for category in self.categories:
+			column.extend(category.columns.column("passed"))
+		return column
+
+	def to_dict(self) -> Dict[str, Any]:
+		return {
+			"passed": self.passed,
+			"total": self.total,
+			"timer": sum(category.timer for category in self.categories),
+			"categories": [category.to_dict() for category in self.categories],
+		}
+
 	def print_groups(self):
 		for category in self.categories:
-			print("%s: %d/%d tests passed in %d ms" % (category.category, category.passed, category.total, category.timer))
+			print("%s: %d/%d tests passed in %d ms (CPU %s ms, peak RSS %s KB%s%s)" % (category.category, category.passed, category.total, category.timer, category.usage.str_cpu(), category.usage.str_max_rss(), category.usage.str_harness(), category.usage.str_strays()))
 
-	def print_table(self):
+	# Every table is built in memory and written at once. Columns are as wide as their
+	# longest cell, but at most max_column_width (never narrower than header), longer
+	# cells are cut.
+	def print_table(self, max_column_width: int = config.MAX_COLUMN_WIDTH):
 		if len(self.categories) == 0:
 			print("No tests.")
 			return
-		width_passed = max(len(CategoryResult.STR_PASSED), max(category.width_passed() for category in self.categories))
-		width_name = max(len(CategoryResult.STR_NAME), max(category.width_name() for category in self.categories))
-		width_is_success = max(len(CategoryResult.STR_IS_SUCCESS), max(category.width_is_success() for category in self.categories))
-		width_input = max(len(CategoryResult.STR_INPUT), max(category.width_input() for category in self.categories))
-		width_actual_output = max(len(CategoryResult.STR_ACTUAL_OUTPUT), max(category.width_actual_output() for category in self.categories))
-		width_expected_output = max(len(CategoryResult.STR_EXPECTED_OUTPUT), max(category.width_expected_output() for category in self.categories))
-		width_empty_error = max(len(CategoryResult.STR_EMPTY_ERROR), max(category.width_empty_error() for category in self.categories))
-		width_exitcode = max(len(CategoryResult.STR_EXITCODE), max(category.width_exitcode() for category in self.categories))
-		width_timer = max(len(CategoryResult.STR_TIMER), max(category.width_timer() for category in self.categories))
-		width = width_passed + width_name + width_is_success + width_input + width_actual_output + width_expected_output + width_empty_error + width_exitcode + width_timer
-		header_head = True
-		for category in self.categories:
-			category.print(width, width_passed, width_name, width_is_success, width_input, width_actual_output, width_expected_output, width_empty_error, width_exitcode, width_timer, header_head)
-			header_head = False
+		rows = [category.cells() for category in self.categories]
+		widths = [len(header) for header in CategoryResult.HEADER]
+		for category_rows in rows:
+			for row in category_rows:
+				widths = [max(width, len(cell)) for width, cell in zip(widths, row)]
+		if max_column_width is not None:
+			widths = [min(width, max(max_column_width, len(header))) for width, header in zip(widths, CategoryResult.HEADER)]
+		sys.stdout.write("".join(category.render(widths, category_rows, i == 0) for i, (category, category_rows) in enumerate(zip(self.categories, rows))))
 
 	def make_bash_envs(self, countable_categories: Dict[str, str], filename: str):
 		if len(self.categories) == 0:
 			print("No counts.")
 			return
 
+		flat, index = self.__indexed()
+		ratios = index.ratios(self.__passed_column(), countable_categories)
 		with open(filename, "w") as file_vars:
 			for count, varname in countable_categories.items():
-				total = 0
-				passed = 0
-				for category in self.categories:
-					for result in category.results:
-						if count in result.categories:
-							total += 1
-							if result.passed:
-								passed += 1
-				final_result = passed / total
-				file_vars.write("%s=%f\n" % (varname.upper(), final_result))
+				file_vars.write("%s=%f\n" % (varname.upper(), ratios[count]))
+				file_vars.write(process.Usage.summary([flat[i].usage for i in index.of(count)]).envs(varname.upper()))
+
+	# Statistics of benchmarked tests as BENCH_<CATEGORY>_<TEST NUMBER>_* variables.
+	def make_bench_envs(self, filename: str):
+		with open(filename, "w") as file_vars:
+			for category in self.categories:
+				for i, result in enumerate(category.results):
+					if result.bench is not None:
+						file_vars.write(result.bench.envs("BENCH_%s_%d" % (bench.env_name(category.category), i + 1)))
 
 	def print_counts(self, countable_categories: List[str]):
 		if len(self.categories) == 0:
@@ -238,17 +278,9 @@ class TesterResult():
 
 		print("\t".join(map(str, countable_categories)))
 
-		counts = []
-		for count in countable_categories:
-			total = 0
-			passed = 0
-			for category in self.categories:
-				for result in category.results:
-					if count in result.categories:
-						total += 1
-						if result.passed:
-							passed += 1
-			counts.append(passed / total)
+		_, index = self.__indexed()
+		ratios = index.ratios(self.__passed_column(), countable_categories)
+		counts = [ratios[count] for count in countable_categories]
 
 		counts_str = "\t".join(map(str, counts))
 		print(counts_str)
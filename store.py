@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Set, Tuple, Union
+
+from suite import config
+from suite import process
+from suite import tools
+
+# Persistent stores.
+
+# Content hashes are remembered until file changes, so executable is hashed once per run.
+class _FileHashes:
+	def __init__(self):
+		self.hashes: Dict[str, Tuple[int, int, str]] = {}
+		self.lock = threading.Lock()
+
+	def get(self, filename: str) -> str:
+		stat = os.stat(filename)
+		with self.lock:
+			cached = self.hashes.get(filename)
+		if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+			cached = (stat.st_mtime_ns, stat.st_size, tools.hash_file(filename))
+			with self.lock:
+				self.hashes[filename] = cached
+		return cached[2]
+
+# Test within category by its name, or by its content if it has no name.
+def test_key(category: str, test) -> str:
+	name = getattr(test, "name", None)
+	if name is None:
+		name = hashlib.sha256(tools.fingerprint(test).encode("utf-8")).hexdigest()
+	return "%s/%s" % (category, name)
+
+# Version of pickled results, bumped when they get new state or when what is cached
+# changes, so entries of older versions (which would unpickle without it) are never hit.
+CACHE_FORMAT = 5
+
+# Results on disk are keyed by executable content and full test definition, so a hit
+# means that the program would be run in exactly the same way as before.
+class ResultCache:
+	def __init__(self, directory: str, max_bytes: int = config.DEFAULT_CACHE_BYTES, bypass: bool = False):
+		self.directory = directory
+		self.max_bytes = max_bytes
+		self.bypass = bypass
+		self.hashes = _FileHashes()
+		self.lock = threading.Lock()
+		os.makedirs(self.directory, exist_ok = True)
+		self.entries: Dict[str, int] = {}
+		for entry in os.scandir(self.directory):
+			if entry.is_file() and not entry.name.startswith("."):
+				self.entries[entry.name] = entry.stat().st_size
+		self.size = sum(self.entries.values())
+
+	def key(self, filename: str, test) -> str:
+		return self.key_of(filename, [tools.fingerprint(test)], test.files())
+
+	# Key from content of executable and files together with any other definition.
+	def key_of(self, filename: str, definition: List[str], files: List[str]) -> str:
+		definition = [str(CACHE_FORMAT), self.hashes.get(filename)] + definition
+		definition += [self.hashes.get(path) for path in files]
+		return hashlib.sha256("\n".join(definition).encode("utf-8")).hexdigest()
+
+	# Location of cache does not change results.
+	def fingerprint(self) -> str:
+		return type(self).__qualname__
+
+	def get(self, key: str):
+		with self.lock:
+			if self.bypass or key not in self.entries:
+				return None
+		path = os.path.join(self.directory, key)
+		try:
+			with open(path, "rb") as file:
+				result = pickle.load(file)
+			# Touching entry keeps it at the fresh end of LRU order.
+			os.utime(path)
+		# Entries pickled by older versions of result classes are misses as well.
+		except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+			return None
+		return result
+
+	def put(self, key: str, result):
+		path = os.path.join(self.directory, key)
+		# Entry appears atomically, so concurrent readers never see a partial file.
+		fd, temporary = tempfile.mkstemp(dir = self.directory, prefix = ".")
+		with os.fdopen(fd, "wb") as file:
+			pickle.dump(result, file)
+		os.replace(temporary, path)
+		size = os.path.getsize(path)
+		with self.lock:
+			self.size += size - self.entries.get(key, 0)
+			self.entries[key] = size
+			self.__evict()
+
+	def __mtime(self, key: str) -> float:
+		try:
+			return os.path.getmtime(os.path.join(self.directory, key))
+		except FileNotFoundError:
+			return 0
+
+	def __evict(self):
+		if self.size <= self.max_bytes:
+			return
+		for key in sorted(self.entries, key = self.__mtime):
+			if self.size <= self.max_bytes:
+				break
+			try:
+				os.remove(os.path.join(self.directory, key))
+			except FileNotFoundError:
+				pass
+			self.size -= self.entries.pop(key)
+
+class ReferenceOutput:
+	def __init__(self, stdout: str, stderr: str, exitcode: int):
+		self.stdout = stdout
+		self.stderr = stderr
+		self.exitcode = exitcode
+
+# Reference executables for differential testing. Their outputs are kept in cache
+# content-addressed by executable, arguments and input, so reference runs only once per
+# input across all graded submissions that share the cache.
+class Reference:
+	def __init__(self, filenames: Union[str, List[str]], cache: ResultCache = None, timeout: int = config.DEFAULT_TIMEOUT):
+		self.filenames = [filenames] if isinstance(filenames, str) else filenames
+		self.cache = cache
+		self.timeout = timeout
+
+	def __key(self, filename: str, args: List[str], input: Union[bytes, str]) -> str:
+		if isinstance(input, str):
+			return self.cache.key_of(filename, ["reference", tools.fingerprint(args)], [input])
+		return self.cache.key_of(filename, ["reference", tools.fingerprint(args), hashlib.sha256(input or b"").hexdigest()], [])
+
+	def __output(self, filename: str, args: List[str], input: Union[bytes, str]) -> ReferenceOutput:
+		key = None
+		if self.cache is not None:
+			key = self.__key(filename, args, input)
+			cached = self.cache.get(key)
+			if cached is not None:
+				return cached
+		execution = process.execute([os.path.abspath(filename)] + args, input, self.timeout)
+		if execution.status == process.Status.TIMEOUT:
+			raise RuntimeError("Reference %s has timed out on %s." % (filename, " ".join(args)))
+		if execution.status != process.Status.FINISHED:
+			raise RuntimeError("Reference %s has not finished normally on %s." % (filename, " ".join(args)))
+		output = ReferenceOutput(execution.stdout, execution.stderr, execution.exitcode)
+		if self.cache is not None:
+			self.cache.put(key, output)
+		return output
+
+	# Outputs of every reference for arguments (without executable) and input (bytes or path to file).
+	def outputs(self, args: List[str], input: Union[bytes, str]) -> List[ReferenceOutput]:
+		return [self.__output(filename, args, input) for filename in self.filenames]
+
+# Wall time of tests from previous runs in one small JSON file, keyed by category and
+# test name (or content of unnamed test). Estimate is exponential moving average.
+class TimingHistory:
+	def __init__(self, path: str, smoothing: float = config.HISTORY_SMOOTHING):
+		self.path = path
+		self.smoothing = smoothing
+		self.lock = threading.Lock()
+		self.timings: Dict[str, float] = {}
+		try:
+			with open(self.path) as file:
+				self.timings = json.load(file)
+		except (OSError, ValueError):
+			pass
+
+	# Expected wall time in microseconds, None for tests that were never run.
+	def estimate(self, category: str, test) -> float:
+		with self.lock:
+			return self.timings.get(test_key(category, test))
+
+	def record(self, category: str, test, wall_us: int):
+		key = test_key(category, test)
+		with self.lock:
+			previous = self.timings.get(key)
+			self.timings[key] = wall_us if previous is None else previous + self.smoothing * (wall_us - previous)
+
+	def save(self):
+		directory = os.path.dirname(os.path.abspath(self.path))
+		fd, temporary = tempfile.mkstemp(dir = directory, prefix = ".")
+		with os.fdopen(fd, "w") as file:
+			with self.lock:
+				json.dump(self.timings, file)
+		os.replace(temporary, self.path)
+
+# Results of tests run by one shard, pickled like cache entries. Every category of suite
+# is kept (even with no tests in this shard) as (name, number of tests in category,
+# positions of tests of this shard in category, their results, timer), so merged result
+# has categories and tests in declaration order.
+class ShardResult:
+	def __init__(self, index: int, count: int, categories: List[Tuple[str, int, List[int], List, int]], timer: int):
+		self.index = index
+		self.count = count
+		self.categories = categories
+		self.timer = timer
+
+	def save(self, filename: str):
+		directory = os.path.dirname(os.path.abspath(filename))
+		fd, temporary = tempfile.mkstemp(dir = directory, prefix = ".")
+		with os.fdopen(fd, "wb") as file:
+			pickle.dump(self, file)
+		os.replace(temporary, filename)
+
+	@staticmethod
+	def load(filename: str) -> 'ShardResult':
+		with open(filename, "rb") as file:
+			return pickle.load(file)
+
+# Outcome of every test run in SQLite database: executable (path and content hash),
+# test key (see test_key), verdict, errno of experimental tests and resource usage.
+class RunStore:
+	SCHEMA = """
+		CREATE TABLE IF NOT EXISTS results (
+			id INTEGER PRIMARY KEY,
+			time REAL NOT NULL,
+			executable TEXT NOT NULL,
+			executable_hash TEXT NOT NULL,
+			category TEXT NOT NULL,
+			test TEXT NOT NULL,
+			passed INTEGER NOT NULL,
+			verdict TEXT,
+			errno INTEGER,
+			wall_us INTEGER,
+			cpu_us INTEGER,
+			max_rss_kb INTEGER
+		);
+		CREATE INDEX IF NOT EXISTS results_by_executable ON results (executable, category, test, id);
+		CREATE INDEX IF NOT EXISTS results_by_test ON results (test, id);
+	"""
+
+	def __init__(self, path: str):
+		self.path = path
+		self.hashes = _FileHashes()
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, check_same_thread = False)
+		self.connection.executescript(RunStore.SCHEMA)
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
+
+	# Rows are written in one transaction by save().
+	def record(self, filename: str, category: str, test, passed: bool, verdict: str, errno: int, usage: process.Usage):
+		row = (time.time(), filename, self.hashes.get(filename), category, test_key(category, test), passed, verdict, errno)
+		if usage is None:
+			row += (None, None, None)
+		else:
+			row += (usage.wall_us, usage.cpu_us(), usage.max_rss_kb)
+		with self.lock:
+			self.connection.execute("INSERT INTO results (time, executable, executable_hash, category, test, passed, verdict, errno, wall_us, cpu_us, max_rss_kb) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+
+	def save(self):
+		with self.lock:
+			self.connection.commit()
+
+	# Keys of tests of category which passed when executable was run last time.
+	def passed(self, filename: str, category: str) -> Set[str]:
+		with self.lock:
+			rows = self.connection.execute("SELECT test, passed FROM results WHERE id IN (SELECT MAX(id) FROM results WHERE executable = ? AND category = ? GROUP BY test)", (filename, category)).fetchall()
+		return {test for test, passed in rows if passed}
+
+	# Every recorded run of test from oldest to newest as dicts with time, executable,
+	# executable_hash, passed, verdict, errno, wall_us, cpu_us and max_rss_kb.
+	def runs(self, category: str, test) -> List[Dict[str, Any]]:
+		columns = ["time", "executable", "executable_hash", "passed", "verdict", "errno", "wall_us", "cpu_us", "max_rss_kb"]
+		with self.lock:
+			rows = self.connection.execute("SELECT %s FROM results WHERE test = ? ORDER BY id" % (", ".join(columns)), (test_key(category, test),)).fetchall()
+		return [dict(zip(columns, row)) for row in rows]
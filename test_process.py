@@ -0,0 +1,23 @@
+from suite import config
+from suite import process
+
+# Output above config.SPILL_THRESHOLD, so it is compared by chunks from the spill file.
+def spilled(output: bytes, expected: str) -> process.TextSink:
+	sink = process.TextSink(expected = expected)
+	for start in range(0, len(output), process.CHUNK_SIZE):
+		sink.feed(output[start:start + process.CHUNK_SIZE])
+	assert sink.spill is not None
+	sink.value()
+	return sink
+
+def test_spilled_output_without_trailing_newline_matches():
+	line = "x" * 99 + "\n"
+	text = line * (2 * config.SPILL_THRESHOLD // len(line))
+	assert spilled(text[:-1].encode("ascii"), text).divergence is None
+	assert spilled(text.encode("ascii"), text).divergence is None
+
+def test_spilled_output_differs():
+	line = "x" * 99 + "\n"
+	text = line * (2 * config.SPILL_THRESHOLD // len(line))
+	assert spilled(text[:-2].encode("ascii"), text).divergence == len(text) - 2
+	assert spilled((text + "y").encode("ascii"), text).divergence == len(text)
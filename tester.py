@@ -1,82 +1,237 @@
-from typing import List, Union
+import asyncio
+import os
+from concurrent.futures import Executor, Future
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, List, Tuple, Union
 
 from suite import config
+from suite import tools
 from suite import asserts
+from suite import batch
+from suite import bench
+from suite import process
 from suite import tests
 from suite import results
+from suite import store
 
 # Testers.
 
-class Tester:
-	def __init__(self, category: str, filename: str, ctor: 'Tester'):
+class Tester(batch.Runs):
+	def __init__(self, category: str, filename: str, ctor: 'Tester', limits: process.Limits = None, reference: store.Reference = None):
 		self.category = category
 		self.filename = filename
+		# Path tests run, resolved once instead of on every run.
+		self.executable = os.path.abspath(filename)
 		self.tests = []
 		self.ctor = ctor
+		self.limits = limits
+		self.reference = reference
+		# Generated tests (see add_generator) are made only when they are run, and only
+		# those for which select(position, test) holds.
+		self.sources: List[batch.TestSource] = []
+		self.select: Callable = None
 
-	def run(self):
-		result: List[results.TestResult] = []
+	# Timings depend on machine and load, so benchmarked tests are never cached, nor are
+	# results which are not definitive (see results.TestResult.is_definitive).
+	def __lookup(self, cache: store.ResultCache, test) -> results.TestResult:
+		if cache is None or test.plan is not None:
+			return None
+		return cache.get(cache.key(self.filename, test))
+
+	# Futures give either cached TestResult or outcome of execution to be checked, tests run
+	# are timed by span of context. With history, executor should be batch.LongestFirst
+	# flushed by caller.
+	def submit(self, executor: Executor, context: batch.RunContext) -> List[Future]:
+		futures = []
+		for test in self.tests:
+			cached = self.__lookup(context.cache, test)
+			if cached is not None:
+				futures.append(Future())
+				futures[-1].set_result(cached)
+			elif context.history is not None:
+				futures.append(executor.submit_estimated(context.history.estimate(self.category, test), context.span.run, test.execute, self.executable, context.plan))
+			else:
+				futures.append(executor.submit(context.span.run, test.execute, self.executable, context.plan))
+		return futures
+
+	# Generated tests run in executor as they are pulled, jobs of them in flight per worker.
+	def stream(self, executor: Executor, jobs: int, context: batch.RunContext) -> Iterator[Tuple[int, Any, Future]]:
+		return batch.stream(executor, lambda test: self.__outcome(test, context), batch.generate(self.sources, self.select), jobs * config.STREAM_WINDOW_PER_JOB)
+
+	def stream_async(self, semaphore: asyncio.Semaphore, jobs: int, context: batch.RunContext) -> AsyncIterator[Tuple[int, Any, asyncio.Future]]:
+		return batch.stream_async(lambda test: tools.run_bounded(semaphore, self.__outcome_async(test, context)), batch.generate(self.sources, self.select), jobs * config.STREAM_WINDOW_PER_JOB)
+
+	def __outcome(self, test, context: batch.RunContext):
+		cached = self.__lookup(context.cache, test)
+		if cached is None:
+			return context.span.run(test.execute, self.executable, context.plan)
+		return cached
+
+	async def __outcome_async(self, test, context: batch.RunContext):
+		cached = self.__lookup(context.cache, test)
+		if cached is None:
+			return await context.span.run_async(test.execute_async(self.executable, context.plan))
+		return cached
+
+	# Semaphore is taken in order of task creation, so with history slow tests are created first.
+	def schedule(self, semaphore: asyncio.Semaphore, context: batch.RunContext) -> List[asyncio.Future]:
+		tasks: List[asyncio.Future] = [None] * len(self.tests)
+		for i in tools.longest_first(self.tests, None if context.history is None else lambda test: context.history.estimate(self.category, test)):
+			test = self.tests[i]
+			cached = self.__lookup(context.cache, test)
+			if cached is None:
+				tasks[i] = asyncio.create_task(tools.run_bounded(semaphore, context.span.run_async(test.execute_async(self.executable, context.plan))))
+			else:
+				tasks[i] = asyncio.get_running_loop().create_future()
+				tasks[i].set_result(cached)
+		return tasks
+
+	# Generated tests given by stream are reported after declared ones.
+	def collect(self, futures: List[Future], context: batch.RunContext, generated: Iterator[Tuple[int, Any, Future]] = None) -> results.CategoryResult:
+		print("=> Test suite: %s tests." % self.category)
+		result = [self.__report(i, test, future, context) for i, (test, future) in enumerate(zip(self.tests, futures))]
+		if generated is not None:
+			result += [self.__report(len(self.tests) + position, test, future, context) for position, test, future in generated]
+		return results.CategoryResult(result, self.category)
+
+	async def collect_async(self, tasks: List[asyncio.Future], context: batch.RunContext, generated: AsyncIterator[Tuple[int, Any, asyncio.Future]] = None) -> results.CategoryResult:
 		print("=> Test suite: %s tests." % self.category)
-		for i, test in enumerate(self.tests):
-			try:
-				name = test.name
-				if name:
-					print("==> Running test \"%s\"" % (name))
-				else:
-					name = str(i + 1)
-					print("==> Running test %d" % (i + 1))
-				test_result: results.TestResult = test.run(self.filename)
-				if test_result.passed:
-					print("===> SUCCESS")
-				else:
-					print("===> FAILED")
-					print("====> ERROR:", test_result.error_message)
-				result.append(test_result)
-			except Exception as err:
-				print("===> FAILED WITH UNKNOWN ERROR. ABORTING...")
-				print(err)
-				exit(config.EXIT_FAILURE)
+		result: List[results.TestResult] = []
+		for i, (test, task) in enumerate(zip(self.tests, tasks)):
+			await asyncio.wait([task])
+			result.append(self.__report(i, test, task, context))
+		if generated is not None:
+			async for position, test, task in generated:
+				await asyncio.wait([task])
+				result.append(self.__report(len(self.tests) + position, test, task, context))
 		return results.CategoryResult(result, self.category)
 
+	def __check(self, test, outcome, cache: store.ResultCache) -> results.TestResult:
+		if isinstance(outcome, results.TestResult):
+			return outcome
+		test_result: results.TestResult = test.check(*outcome)
+		if cache is not None and test.plan is None and test_result.bench is None and test_result.is_definitive():
+			cache.put(cache.key(self.filename, test), test_result)
+		return test_result
+
+	def __report(self, i: int, test, future: Union[Future, asyncio.Future], context: batch.RunContext) -> results.TestResult:
+		try:
+			name = test.name
+			if name:
+				print("==> Running test \"%s\"" % (name))
+			else:
+				name = str(i + 1)
+				print("==> Running test %d" % (i + 1))
+			test_result = self.__check(test, future.result(), context.cache)
+			if test_result.passed:
+				print("===> SUCCESS")
+			else:
+				print("===> FAILED")
+				print("====> ERROR:", test_result.error_message)
+			if test_result.bench is not None:
+				print("====> BENCHMARK:", test_result.bench)
+			if context.history is not None and test_result.usage is not None:
+				context.history.record(self.category, test, test_result.usage.wall_us)
+			if context.runs is not None:
+				context.runs.record(self.filename, self.category, test, test_result.passed, test_result.str_passed(), None, test_result.usage)
+			return test_result
+		except Exception as err:
+			print("===> FAILED WITH UNKNOWN ERROR. ABORTING...")
+			print(err)
+			exit(config.EXIT_FAILURE)
+
 	def extract_only(self, categories: List[str]):
-		new_tester = Tester(self.category, self.filename, self.ctor)
-		categoriesS = set(categories)
-		for test in self.tests:
-			if set(test.categories).issubset(categoriesS):
-				new_tester.add_test(test)
+		new_tester = Tester(self.category, self.filename, self.ctor, self.limits, self.reference)
+		index = tools.CategoryIndex([test.categories for test in self.tests])
+		for i in index.within(set(categories)):
+			new_tester.add_test(self.tests[i])
+		new_tester.sources = [source for source in self.sources if set(source.categories).issubset(categories)]
 		return new_tester
 
 	def add_test(self, test):
 		self.tests.append(test)
 
-	def add_fail(self, input: Union[List[str], str], expected_exitcode: int, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], show_diff: bool = False):
-		self.add_easy(input, None, expected_exitcode, timeout, name, categories, show_diff)
+	# Limits of test win over limits of tester.
+	def __limits(self, limits: process.Limits) -> process.Limits:
+		if limits is None:
+			return self.limits
+		return limits.merge(self.limits)
+
+	def add_fail(self, input: Union[List[str], str], expected_exitcode: int, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], show_diff: bool = False, max_output_bytes: int = None, limits: process.Limits = None):
+		self.add_easy(input, None, expected_exitcode, timeout, name, categories, show_diff, max_output_bytes = max_output_bytes, limits = limits)
 
-	def add_easy(self, input: Union[List[str], str], expected: Union[List[str], str], expected_exitcode: int = config.ERROR_SUCCESS, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], show_diff: bool = False):
-		expected = asserts.Expected(expected, is_success = expected_exitcode == config.ERROR_SUCCESS, exitcode = expected_exitcode, show_diff = show_diff)
-		self.tests.append(self.ctor(input, expected, timeout, name, categories))
+	# With early_abort, program is stopped as soon as its output differs from expected.
+	def add_easy(self, input: Union[List[str], str], expected: Union[List[str], str], expected_exitcode: int = config.ERROR_SUCCESS, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], show_diff: bool = False, early_abort: bool = False, max_output_bytes: int = None, limits: process.Limits = None):
+		expected = asserts.Expected(expected, is_success = expected_exitcode == config.ERROR_SUCCESS, exitcode = expected_exitcode, show_diff = show_diff, early_abort = early_abort)
+		self.tests.append(self.ctor(input, expected, timeout, name, categories, max_output_bytes, self.__limits(limits)))
 
-	def add_hard(self, input: Union[List[str], str], expected: str, expected_exitcode: int = config.ERROR_SUCCESS, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = []):
+	# Tests are made from (input, expected output) pairs of iterable returned by generator
+	# only when they are run, so memory is bounded by number of tests in flight instead of
+	# size of suite. Generator is called on every run.
+	def add_generator(self, generator: Callable[[], Iterable[Tuple[Union[List[str], str], Union[List[str], str]]]], expected_exitcode: int = config.ERROR_SUCCESS, timeout: int = config.DEFAULT_TIMEOUT, categories: List[str] = [], show_diff: bool = False, early_abort: bool = False, max_output_bytes: int = None, limits: process.Limits = None):
+		limits = self.__limits(limits)
+		def make(input, expected):
+			expected = asserts.Expected(expected, is_success = expected_exitcode == config.ERROR_SUCCESS, exitcode = expected_exitcode, show_diff = show_diff, early_abort = early_abort)
+			return self.ctor(input, expected, timeout, None, categories, max_output_bytes, limits)
+		self.sources.append(batch.TestSource(generator, make, categories))
+
+	# Same as add_generator, but iterator is used up by first run, so tests can be run only once.
+	def add_from_iterable(self, pairs: Iterable[Tuple[Union[List[str], str], Union[List[str], str]]], expected_exitcode: int = config.ERROR_SUCCESS, timeout: int = config.DEFAULT_TIMEOUT, categories: List[str] = [], show_diff: bool = False, early_abort: bool = False, max_output_bytes: int = None, limits: process.Limits = None):
+		self.add_generator(lambda: pairs, expected_exitcode, timeout, categories, show_diff, early_abort, max_output_bytes, limits)
+		self.sources[-1].once = True
+
+	def add_hard(self, input: Union[List[str], str], expected: str, expected_exitcode: int = config.ERROR_SUCCESS, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], max_output_bytes: int = None, limits: process.Limits = None):
 		expected = asserts.Expected(expected, is_sha256 = True, exitcode = expected_exitcode)
-		self.tests.append(self.ctor(input, expected, timeout, name, categories))
+		self.tests.append(self.ctor(input, expected, timeout, name, categories, max_output_bytes, self.__limits(limits)))
+
+	# Test is run warmup + repeat times one after another and passes if its output is
+	# correct and timing statistics fit into budget.
+	def add_bench(self, input: Union[List[str], str], expected: Union[List[str], str], budget: bench.Budget, warmup: int = config.DEFAULT_WARMUP, repeat: int = config.DEFAULT_REPEAT, expected_exitcode: int = config.ERROR_SUCCESS, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], max_output_bytes: int = None, limits: process.Limits = None):
+		expected = asserts.Expected(expected, is_success = expected_exitcode == config.ERROR_SUCCESS, exitcode = expected_exitcode)
+		test = self.ctor(input, expected, timeout, name, categories, max_output_bytes, self.__limits(limits))
+		test.plan = bench.Plan(warmup, repeat, budget)
+		self.tests.append(test)
+
+	# Program is run with input made by generator at every size, test passes if its running
+	# time grows no faster than expected complexity (one of bench.COMPLEXITIES).
+	def add_scaling(self, generator: Callable[[int], Union[List[str], str]], sizes: List[int], expected: str, warmup: int = config.DEFAULT_WARMUP, repeat: int = config.DEFAULT_REPEAT, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], max_output_bytes: int = None, limits: process.Limits = None):
+		# Sizes are checked before generator is called with them.
+		bench.check_sizes(sizes)
+		limits = self.__limits(limits)
+		inputs = [self.ctor(generator(size), asserts.Expected(), timeout, name, categories, max_output_bytes, limits) for size in sizes]
+		self.tests.append(tests.ScalingTest(inputs, sizes, expected, bench.Plan(warmup, repeat), timeout, name, categories, max_output_bytes, limits))
+
+	# Expected output is given by reference executable of tester run on the same input.
+	def add_diff(self, input: Union[List[str], str], timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], show_diff: bool = False, max_output_bytes: int = None, limits: process.Limits = None):
+		if self.reference is None:
+			raise ValueError("Differential test needs tester with reference executable.")
+		test = self.ctor(input, asserts.Expected(), timeout, name, categories, max_output_bytes, self.__limits(limits))
+		self.tests.append(tests.DiffTest(test, self.reference, show_diff))
+
+	# Expected output is read from golden file and input_file (if any) is attached to stdin,
+	# neither of them is loaded into memory.
+	def add_golden(self, input: Union[List[str], str], expected_file: str, input_file: str = None, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], max_output_bytes: int = None, limits: process.Limits = None):
+		expected = asserts.Expected(golden = expected_file)
+		test = self.ctor(input, expected, timeout, name, categories, max_output_bytes, self.__limits(limits))
+		test.input_file = input_file
+		self.tests.append(test)
 
 class IOTester(Tester):
-	def __init__(self, category: str, filename: str):
-		Tester.__init__(self, category, filename, tests.IOTest)
+	def __init__(self, category: str, filename: str, limits: process.Limits = None, reference: store.Reference = None):
+		Tester.__init__(self, category, filename, tests.IOTest, limits, reference)
 
 class CmdTester(Tester):
-	def __init__(self, category: str, filename: str):
-		Tester.__init__(self, category, filename, tests.CmdTest)
+	def __init__(self, category: str, filename: str, limits: process.Limits = None, reference: store.Reference = None):
+		Tester.__init__(self, category, filename, tests.CmdTest, limits, reference)
 
-class MegaTester():
+class MegaTester(batch.SuiteRuns):
 	def __init__(self):
 		self.testers: List[Tester] = []
 
 	def add_tester(self, tester: Tester):
 		self.testers.append(tester)
 
-	def run(self):
-		categories = []
-		for tester in self.testers:
-			categories.append(tester.run())
+	def _result(self, categories: List[results.CategoryResult], timer: int) -> results.TesterResult:
 		return results.TesterResult(categories)
+
+	def _tests(self, category: results.CategoryResult) -> List[results.TestResult]:
+		return category.results
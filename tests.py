@@ -1,54 +1,243 @@
-import os
-import subprocess
+import asyncio
+import copy
 import time
-from typing import List
+from typing import List, Tuple, Union
 
 from suite import config
 from suite import asserts
+from suite import bench
+from suite import process
 from suite import results
+from suite import store
+from suite import tools
 
 # Tests.
 
-class IOTest:
-	def __init__(self, input: str, expected_result: asserts.Expected, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = []):
-		self.input = (' '.join(input) + "\n").encode("ascii")
+class Test:
+	def __init__(self, expected_result: asserts.Expected, timeout: int, name: str, categories: List[str], max_output_bytes: int, limits: process.Limits):
 		self.expected_result = expected_result
 		self.timeout = timeout
 		self.name = name
 		self.categories = categories
+		self.max_output_bytes = max_output_bytes
+		self.limits = limits
+		self.input_file: str = None
+		self.plan: bench.Plan = None
 
-	def run(self, filename: str):
-		executable = os.path.abspath(filename)
-		start = time.time_ns() // 1000000
-		program = subprocess.Popen([executable], stdout = subprocess.PIPE, stdin = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
-		try:
-			output, error = program.communicate(self.input.decode("utf-8"), timeout = self.timeout)
-			end = time.time_ns() // 1000000
-			result = asserts.Actual(output, error, program.returncode)
-			return self.expected_result.compare(result, end - start, self.name, self.input.decode("ascii"), self.categories)
-		except subprocess.TimeoutExpired:
-			program.kill()
-			end = time.time_ns() // 1000000
-			return results.TestResult(False, self.name, self.expected_result.is_success, self.input.decode("ascii"), None, self.expected_result.stdout, self.expected_result.is_success != True, end - start, "Timeout.", categories = self.categories)
-
-class CmdTest:
-	def __init__(self, input: List[str], expected_result: asserts.Expected, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = []):
+	def argv(self, filename: str) -> List[str]:
+		return [tools.resolve(filename)] + self.args()
+
+	def args(self) -> List[str]:
+		return []
+
+	def stdin(self) -> Union[bytes, str]:
+		return self.input_file
+
+	def str_input(self) -> str:
+		return ' '.join(self.args()) + self.str_input_file()
+
+	# Files the test depends on besides executable.
+	def files(self) -> List[str]:
+		return [path for path in [self.input_file, self.expected_result.golden] if path is not None]
+
+	def str_input_file(self) -> str:
+		return "" if self.input_file is None else " < %s" % (self.input_file)
+
+	def __actual(self, execution: process.Execution, sink) -> Tuple[asserts.Actual, process.Usage]:
+		if execution.timeout:
+			return None, execution.usage
+		if execution.output_limit:
+			return asserts.Actual(execution.stdout, execution.stderr, execution.exitcode, output_limit = self.__output_limit()), execution.usage
+		if execution.limit_exceeded and not self.__expects(execution.exitcode):
+			return asserts.Actual(execution.stdout, execution.stderr, execution.exitcode, limit = self.limits.str_breach(execution.status), verdict = execution.status), execution.usage
+		divergence = getattr(sink, "divergence", None)
+		return asserts.Actual(execution.stdout, execution.stderr, execution.exitcode, self.expected_result.is_sha256, divergence, stopped = execution.aborted), execution.usage
+
+	# Failure the test expects is never reported as limit breach.
+	def __expects(self, exitcode: int) -> bool:
+		return not self.expected_result.is_success and exitcode == self.expected_result.exitcode
+
+	def __output_limit(self) -> int:
+		return self.max_output_bytes or config.DEFAULT_MAX_OUTPUT_BYTES
+
+	def __execute(self, filename: str) -> Tuple[asserts.Actual, process.Usage]:
+		sink = self.expected_result.make_sink()
+		return self.__actual(process.execute(self.argv(filename), self.stdin(), self.timeout, sink, self.__output_limit(), self.limits), sink)
+
+	async def __execute_async(self, filename: str) -> Tuple[asserts.Actual, process.Usage]:
+		sink = self.expected_result.make_sink()
+		return self.__actual(await process.execute_async(self.argv(filename), self.stdin(), self.timeout, sink, self.__output_limit(), self.limits), sink)
+
+	# Benchmark is stopped by runs that have not finished normally.
+	@staticmethod
+	def __broken(outcome: Tuple[asserts.Actual, process.Usage]) -> bool:
+		actual = outcome[0]
+		return actual is None or actual.output_limit is not None or actual.limit is not None
+
+	# Plan of test itself wins over plan of benchmark mode. Benchmarked outcome is
+	# last (or first broken) run together with statistics of all measured runs.
+	def execute(self, filename: str, plan: bench.Plan = None) -> Tuple:
+		plan = self.plan or plan
+		if plan is None:
+			return self.__execute(filename)
+		(actual, usage), benchmark = plan.run(lambda: self.__execute(filename), lambda outcome: outcome[1], Test.__broken)
+		return actual, usage, benchmark
+
+	async def execute_async(self, filename: str, plan: bench.Plan = None) -> Tuple:
+		plan = self.plan or plan
+		if plan is None:
+			return await self.__execute_async(filename)
+		(actual, usage), benchmark = await plan.run_async(lambda: self.__execute_async(filename), lambda outcome: outcome[1], Test.__broken)
+		return actual, usage, benchmark
+
+	def check(self, actual: asserts.Actual, usage: process.Usage, benchmark: bench.Benchmark = None) -> results.TestResult:
+		timer = usage.wall_us // 1000
+		if actual is None:
+			test_result = results.TestResult(False, self.name, self.expected_result.is_success, self.str_input(), None, self.expected_result.stdout, self.expected_result.is_success != True, timer, None, "Timeout.", categories = self.categories, verdict = process.Status.TIMEOUT)
+		else:
+			start = time.perf_counter_ns()
+			test_result = self.expected_result.compare(actual, timer, self.name, self.str_input(), self.categories)
+			usage.compare_us = (time.perf_counter_ns() - start) // 1000
+		test_result.usage = usage
+		test_result.bench = benchmark
+		if test_result.passed and self.plan is not None and self.plan.budget is not None and benchmark is not None:
+			error = self.plan.budget.check(benchmark)
+			if error is not None:
+				test_result.passed = False
+				test_result.error_message = error[0].upper() + error[1:] + "."
+		return test_result
+
+	def run(self, filename: str, plan: bench.Plan = None):
+		return self.check(*self.execute(filename, plan))
+
+class IOTest(Test):
+	def __init__(self, input: str, expected_result: asserts.Expected, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], max_output_bytes: int = None, limits: process.Limits = None):
+		Test.__init__(self, expected_result, timeout, name, categories, max_output_bytes, limits)
+		self.input = (' '.join(input) + "\n").encode("ascii")
+
+	def stdin(self) -> Union[bytes, str]:
+		if self.input_file is not None:
+			return self.input_file
+		return self.input
+
+	def str_input(self) -> str:
+		if self.input_file is not None:
+			return self.str_input_file().lstrip()
+		return self.input.decode("ascii")
+
+class CmdTest(Test):
+	def __init__(self, input: List[str], expected_result: asserts.Expected, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], max_output_bytes: int = None, limits: process.Limits = None):
+		Test.__init__(self, expected_result, timeout, name, categories, max_output_bytes, limits)
 		self.input = input
-		self.expected_result = expected_result
-		self.timeout = timeout
-		self.name = name
-		self.categories = categories
 
-	def run(self, filename: str):
-		executable = os.path.abspath(filename)
-		start = time.time_ns() // 1000000
-		program = subprocess.Popen([executable] + self.input, stdout = subprocess.PIPE, stdin = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+	def args(self) -> List[str]:
+		return self.input
+
+# Runs program at every size and fits measured times against complexity curves of
+# bench.COMPLEXITIES. Output is not checked, program should only succeed at every size.
+class ScalingTest(Test):
+	def __init__(self, tests: List[Test], sizes: List[int], expected_complexity: str, plan: bench.Plan, timeout: int = config.DEFAULT_TIMEOUT, name: str = None, categories: List[str] = [], max_output_bytes: int = None, limits: process.Limits = None):
+		if expected_complexity not in bench.COMPLEXITIES:
+			raise ValueError("Complexity should be one of %s." % (", ".join(bench.COMPLEXITIES)))
+		bench.check_sizes(sizes)
+		Test.__init__(self, asserts.Expected(), timeout, name, categories, max_output_bytes, limits)
+		self.tests = tests
+		self.sizes = sizes
+		self.expected_complexity = expected_complexity
+		self.plan = plan
+
+	def str_input(self) -> str:
+		return "sizes " + ", ".join(map(str, self.sizes))
+
+	@staticmethod
+	def __failed(execution: process.Execution) -> bool:
+		return execution.status != process.Status.FINISHED or execution.exitcode != config.EXIT_SUCCESS
+
+	def __str_failure(self, size: int, execution: process.Execution) -> str:
+		if execution.timeout:
+			return "Timeout at size %d." % (size)
+		if execution.output_limit:
+			return "Output limit exceeded at size %d." % (size)
+		if execution.limit_exceeded:
+			error = self.limits.str_breach(execution.status)
+			return "%s at size %d." % (error[0].upper() + error[1:], size)
+		return "Program fails at size %d, returns %d." % (size, execution.exitcode)
+
+	# Outcome is error of failed run or fit of typical times at all sizes.
+	def execute(self, filename: str, plan: bench.Plan = None) -> Tuple[str, process.Usage, bench.Fit]:
+		usages = []
+		times = []
+		for size, test in zip(self.sizes, self.tests):
+			once = lambda: process.execute(test.argv(filename), test.stdin(), self.timeout, process.NullSink(), self.max_output_bytes, self.limits)
+			execution, benchmark = self.plan.run(once, lambda execution: execution.usage, ScalingTest.__failed)
+			usages.append(execution.usage)
+			if ScalingTest.__failed(execution):
+				return self.__str_failure(size, execution), process.Usage.summary(usages), None
+			times.append(benchmark.typical())
+		return None, process.Usage.summary(usages), bench.fit(self.sizes, times)
+
+	async def execute_async(self, filename: str, plan: bench.Plan = None) -> Tuple[str, process.Usage, bench.Fit]:
+		usages = []
+		times = []
+		for size, test in zip(self.sizes, self.tests):
+			once = lambda: process.execute_async(test.argv(filename), test.stdin(), self.timeout, process.NullSink(), self.max_output_bytes, self.limits)
+			execution, benchmark = await self.plan.run_async(once, lambda execution: execution.usage, ScalingTest.__failed)
+			usages.append(execution.usage)
+			if ScalingTest.__failed(execution):
+				return self.__str_failure(size, execution), process.Usage.summary(usages), None
+			times.append(benchmark.typical())
+		return None, process.Usage.summary(usages), bench.fit(self.sizes, times)
+
+	def check(self, error: str, usage: process.Usage, fit: bench.Fit) -> results.TestResult:
+		passed = error is None and fit.fits(self.expected_complexity)
+		if error is None and not passed:
+			error = "Running time grows as %s, but should grow at most as O(%s)." % (fit, self.expected_complexity)
+		test_result = results.TestResult(passed, self.name, True, self.str_input(), None if fit is None else str(fit), "O(%s)" % (self.expected_complexity), True, usage.wall_us // 1000, None, error, self.categories)
+		test_result.usage = usage
+		return test_result
+
+# Expected result is made from outputs of reference executables run on the same input:
+# output of every succeeded reference is one of options, or exitcode of reference if it fails.
+class DiffTest(Test):
+	def __init__(self, test: Test, reference: store.Reference, show_diff: bool = False):
+		Test.__init__(self, test.expected_result, test.timeout, test.name, test.categories, test.max_output_bytes, test.limits)
+		self.test = test
+		self.reference = reference
+		self.show_diff = show_diff
+
+	def str_input(self) -> str:
+		return self.test.str_input()
+
+	def files(self) -> List[str]:
+		return self.test.files() + self.reference.filenames
+
+	def __expected(self) -> asserts.Expected:
+		outputs = self.reference.outputs(self.test.args(), self.test.stdin())
+		if outputs[0].exitcode != config.EXIT_SUCCESS:
+			return asserts.Expected(None, is_success = False, exitcode = outputs[0].exitcode)
+		stdouts = list(dict.fromkeys(output.stdout for output in outputs if output.exitcode == config.EXIT_SUCCESS))
+		return asserts.Expected(stdouts[0] if len(stdouts) == 1 else stdouts, show_diff = self.show_diff)
+
+	# Outcome starts with copy of wrapped test that expects output of reference, or is
+	# None with error of reference which has not finished normally (such as timeout).
+	def execute(self, filename: str, plan: bench.Plan = None) -> Tuple:
+		test = copy.copy(self.test)
 		try:
-			output, error = program.communicate(timeout = self.timeout)
-			end = time.time_ns() // 1000000
-			result = asserts.Actual(output, error, program.returncode)
-			return self.expected_result.compare(result, end - start, self.name, (' '.join(self.input)), self.categories)
-		except subprocess.TimeoutExpired:
-			program.kill()
-			end = time.time_ns() // 1000000
-			return results.TestResult(False, self.name, self.expected_result.is_success, (' '.join(self.input)), None, self.expected_result.stdout, self.expected_result.is_success != True, end - start, "Timeout.", categories = self.categories)
+			test.expected_result = self.__expected()
+		except RuntimeError as err:
+			return None, str(err)
+		return (test,) + tuple(test.execute(filename, plan))
+
+	async def execute_async(self, filename: str, plan: bench.Plan = None) -> Tuple:
+		test = copy.copy(self.test)
+		try:
+			# Reference may be run here, so it is moved off event loop.
+			test.expected_result = await asyncio.to_thread(self.__expected)
+		except RuntimeError as err:
+			return None, str(err)
+		return (test,) + tuple(await test.execute_async(filename, plan))
+
+	def check(self, test: Test, *outcome) -> results.TestResult:
+		if test is None:
+			return results.TestResult(False, self.name, True, self.str_input(), None, None, True, 0, None, outcome[0], self.categories)
+		return test.check(*outcome)
@@ -1,16 +1,20 @@
-from typing import List
+import array
+import asyncio
+import hashlib
+import locale
+from enum import Enum
+import math
+import os
+import re
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Set, TypeVar
+
+T = TypeVar("T")
+
+_ESCAPES = str.maketrans({"\t": "\\t", "\n": "\\n", "\r": "\\r", "\\": "\\\\"})
 
 # Escape single string.
 def escape(raw: str) -> str:
-	escaped = ""
-	for c in raw:
-		match c:
-			case '\t': escaped += "\\t"
-			case '\n': escaped += "\\n"
-			case '\r': escaped += "\\r"
-			case '\\': escaped += "\\\\"
-			case _: escaped += c
-	return escaped
+	return raw.translate(_ESCAPES)
 
 # Escape multi strings with delim into one string.
 def escape_multi(raw: List[str], delim: str) -> str:
@@ -21,3 +25,142 @@ def escape_multi(raw: List[str], delim: str) -> str:
 # Escape multi strings as "<str> OR <str> ...".
 def escape_multi_or(raw: List[str]) -> str:
 	return escape_multi(raw, " OR ")
+
+# Decode raw process output the same way as subprocess text mode does. Raw output may be
+# any buffer (like mmap), which is decoded without copying it to bytes first.
+def decode_output(raw: bytes, errors: str = "strict") -> str:
+	return str(raw, locale.getpreferredencoding(False), errors).replace("\r\n", "\n").replace("\r", "\n")
+
+# Cut string to length, marking that it was truncated.
+def truncate(raw: str, length: int) -> str:
+	if raw is None or len(raw) <= length:
+		return raw
+	return raw[:length] + "..."
+
+_interned: Dict[Any, Any] = {}
+
+# Shared copy of equal immutable value (like tuple of categories), so results of tests
+# with the same categories do not each keep their own.
+def intern(value: T) -> T:
+	return _interned.setdefault(value, value)
+
+# Await coroutine while holding semaphore, bounding number of concurrent runs.
+async def run_bounded(semaphore: asyncio.Semaphore, coroutine: Awaitable[T]) -> T:
+	async with semaphore:
+		return await coroutine
+
+# Cancel tasks that are not finished yet.
+def cancel_tasks(tasks: List[asyncio.Task]):
+	for task in tasks:
+		if not task.done():
+			task.cancel()
+
+# Indices of items with longest estimate first, unknown (None) estimates go first and
+# ties keep original order. Without estimate function order is kept as is.
+def longest_first(items: List[Any], estimate: Callable[[Any], float] = None) -> List[int]:
+	if estimate is None:
+		return list(range(len(items)))
+	estimates = [estimate(item) for item in items]
+	return sorted(range(len(items)), key = lambda i: -(math.inf if estimates[i] is None else estimates[i]))
+
+# Positions of items by every category they belong to, built in one pass, so filters
+# and per category counts do not scan all items for every category.
+class CategoryIndex:
+	def __init__(self, categories: List[Iterable[str]]):
+		self.size = len(categories)
+		self.positions: Dict[str, List[int]] = {}
+		for i, item in enumerate(categories):
+			for category in dict.fromkeys(item):
+				self.positions.setdefault(category, []).append(i)
+
+	def of(self, category: str) -> List[int]:
+		return self.positions.get(category, [])
+
+	# Positions of items with all of their categories among given ones, in order.
+	def within(self, categories: Set[str]) -> List[int]:
+		excluded: Set[int] = set()
+		for category, positions in self.positions.items():
+			if category not in categories:
+				excluded.update(positions)
+		return [i for i in range(self.size) if i not in excluded]
+
+	# Share of flagged items in every category, category without items has 0.0.
+	def ratios(self, flags: List[bool], categories: Iterable[str]) -> Dict[str, float]:
+		ratios = {}
+		for category in categories:
+			positions = self.of(category)
+			ratios[category] = sum(1 for i in positions if flags[i]) / len(positions) if len(positions) > 0 else 0.0
+		return ratios
+
+# Numeric fields of many records kept in typed arrays, one per field, instead of in every
+# record. In "q" columns None is kept as MISSING.
+class Columns:
+	MISSING = -2 ** 63
+
+	def __init__(self, fields: Dict[str, str]):
+		self.columns = {field: array.array(typecode) for field, typecode in fields.items()}
+
+	def __len__(self) -> int:
+		return len(next(iter(self.columns.values())))
+
+	# Adds record with values of all fields, gives its row.
+	def append(self, values: Dict[str, Any]) -> int:
+		for field, column in self.columns.items():
+			column.append(Columns.MISSING if values[field] is None else values[field])
+		return len(self) - 1
+
+	def get(self, field: str, row: int) -> Any:
+		value = self.columns[field][row]
+		return None if value == Columns.MISSING else value
+
+	def set(self, field: str, row: int, value: Any):
+		self.columns[field][row] = Columns.MISSING if value is None else value
+
+	# Values of field of all records.
+	def column(self, field: str) -> array.array:
+		return self.columns[field]
+
+	# Values of all fields of record.
+	def row(self, row: int) -> Dict[str, Any]:
+		return {field: self.get(field, row) for field in self.columns}
+
+# Absolute path of executable, testers resolve it once, so their paths are kept as is.
+def resolve(filename: str) -> str:
+	return filename if os.path.isabs(filename) else os.path.abspath(filename)
+
+# SHA-256 of file content, read by chunks.
+def hash_file(filename: str) -> str:
+	digest = hashlib.sha256()
+	with open(filename, "rb") as file:
+		for chunk in iter(lambda: file.read(1024 * 1024), b""):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+# Deterministic string view of value built from its content, independent from object identity.
+# Objects may define fingerprint() to leave out state that does not affect test results.
+def fingerprint(value: Any) -> str:
+	if hasattr(value, "fingerprint") and not isinstance(value, type):
+		return value.fingerprint()
+	if value is None or isinstance(value, (bool, int, float, str, bytes, Enum, array.array)):
+		return repr(value)
+	if isinstance(value, re.Pattern):
+		return "re.compile(%r, %d)" % (value.pattern, value.flags)
+	if isinstance(value, (list, tuple)):
+		return "[%s]" % (", ".join(fingerprint(item) for item in value))
+	if isinstance(value, (set, frozenset)):
+		return "{%s}" % (", ".join(sorted(fingerprint(item) for item in value)))
+	if isinstance(value, dict):
+		return "{%s}" % (", ".join(sorted("%s: %s" % (fingerprint(key), fingerprint(item)) for key, item in value.items())))
+	if callable(value) and hasattr(value, "__qualname__"):
+		return "%s.%s" % (value.__module__, value.__qualname__)
+	return "%s%s" % (type(value).__qualname__, fingerprint(_state(value)))
+
+# Attributes of object, including those kept in slots.
+def _state(value: Any) -> Dict[str, Any]:
+	state = dict(getattr(value, "__dict__", {}))
+	for cls in type(value).__mro__:
+		slots = getattr(cls, "__slots__", ())
+		for name in [slots] if isinstance(slots, str) else slots:
+			if hasattr(value, name):
+				state[name] = getattr(value, name)
+	return state